@@ -1,8 +1,13 @@
 # Reflection code generation configuration for ZEngineDemo
 # This file configures ZParser to generate reflection code for serialization support
 
-# Set paths for precompile tools
-set(PRECOMPILE_TOOLS_PATH "${ZENGINE_ROOT}/bin")
+# Set paths for precompile tools; engine targets exported by a shared engine
+# tree (Z_ENGINE_TREE) put ZParser where a source build does
+if(ZENGINE_PREBUILT AND ZENGINE_PREBUILT_DIR)
+    set(PRECOMPILE_TOOLS_PATH "${ZENGINE_PREBUILT_DIR}/bin")
+else()
+    set(PRECOMPILE_TOOLS_PATH "${ZENGINE_ROOT}/bin")
+endif()
 set(Z_PRECOMPILE_PARAMS_IN_PATH "${PROJECT_ROOT_DIR}/precompile.json.in")
 set(Z_PRECOMPILE_PARAMS_PATH "${CMAKE_BINARY_DIR}/precompile.json")
 configure_file(${Z_PRECOMPILE_PARAMS_IN_PATH} ${Z_PRECOMPILE_PARAMS_PATH})
@@ -34,19 +39,64 @@ set(PARSER_INPUT ${CMAKE_BINARY_DIR}/parser_header.h)
 # Create stamp file for dependency tracking
 set(PRECOMPILE_STAMP ${CMAKE_BINARY_DIR}/.precompile_stamp)
 
-# Custom command to run meta parser
-add_custom_command(
-    OUTPUT ${PRECOMPILE_STAMP}
-    BYPRODUCTS ${PARSER_INPUT}
-    DEPENDS ${Z_PRECOMPILE_PARAMS_PATH} $<TARGET_FILE:ZParser>
-    COMMENT "Running meta parser for ZEngineDemo reflection code generation"
-    COMMAND
-        ${CMAKE_COMMAND} -E echo "[Precompile] Generating reflection code for ZEngineDemo..."
-    COMMAND
-        ${PRECOMPILE_PARSER} "${Z_PRECOMPILE_PARAMS_PATH}" "${PARSER_INPUT}" "${PROJECT_ROOT_DIR}/source" ${sys_include} "ZEngineDemo" 0
-    COMMAND
-        ${CMAKE_COMMAND} -E touch ${PRECOMPILE_STAMP}
-)
+# Incremental generation through zbuild: only headers whose content, or that of a
+# project header they include, changed since the last run are parsed again
+option(Z_INCREMENTAL_PRECOMPILE "Regenerate reflection code only for changed headers (needs Python 3)" ON)
+if(Z_INCREMENTAL_PRECOMPILE)
+    find_package(Python3 COMPONENTS Interpreter QUIET)
+    if(NOT Python3_Interpreter_FOUND)
+        message(WARNING "Python 3 not found, reflection code is regenerated for all headers")
+    endif()
+endif()
+
+if(Z_INCREMENTAL_PRECOMPILE AND Python3_Interpreter_FOUND)
+    # zbuild also hashes the engine headers the project headers include; it lists
+    # them in a depfile where the generator reads one, so editing them re-runs it
+    set(PRECOMPILE_DEPFILE_ARGS)
+    if(CMAKE_VERSION VERSION_GREATER_EQUAL 3.20 AND CMAKE_GENERATOR MATCHES "Ninja|Makefiles")
+        if(POLICY CMP0116)
+            cmake_policy(SET CMP0116 NEW)
+        endif()
+        set(PRECOMPILE_DEPFILE_ARGS DEPFILE ${PRECOMPILE_STAMP}.d)
+    endif()
+    add_custom_command(
+        OUTPUT ${PRECOMPILE_STAMP}
+        BYPRODUCTS ${PARSER_INPUT}
+        DEPENDS ${Z_PRECOMPILE_PARAMS_PATH} $<TARGET_FILE:ZParser> ${PROJECT_HEADER_FILES}
+        ${PRECOMPILE_DEPFILE_ARGS}
+        COMMENT "Running meta parser for ZEngineDemo reflection code generation"
+        COMMAND
+            ${CMAKE_COMMAND} -E echo "[Precompile] Generating reflection code for ZEngineDemo..."
+        COMMAND
+            ${Python3_EXECUTABLE} "${PROJECT_ROOT_DIR}/zbuild.py" precompile
+                --build-dir "${CMAKE_BINARY_DIR}"
+                --parser "${PRECOMPILE_PARSER}"
+                --params "${Z_PRECOMPILE_PARAMS_PATH}"
+                --parser-input "${PARSER_INPUT}"
+                --source-dir "${PROJECT_ROOT_DIR}/source"
+                --sys-include "${sys_include}"
+                --module "ZEngineDemo"
+                --include-dirs "$<TARGET_PROPERTY:ZRuntime,INTERFACE_INCLUDE_DIRECTORIES>"
+                --depfile "${PRECOMPILE_STAMP}.d"
+        COMMAND
+            ${CMAKE_COMMAND} -E touch ${PRECOMPILE_STAMP}
+        COMMAND_EXPAND_LISTS
+    )
+else()
+    # Custom command to run meta parser
+    add_custom_command(
+        OUTPUT ${PRECOMPILE_STAMP}
+        BYPRODUCTS ${PARSER_INPUT}
+        DEPENDS ${Z_PRECOMPILE_PARAMS_PATH} $<TARGET_FILE:ZParser>
+        COMMENT "Running meta parser for ZEngineDemo reflection code generation"
+        COMMAND
+            ${CMAKE_COMMAND} -E echo "[Precompile] Generating reflection code for ZEngineDemo..."
+        COMMAND
+            ${PRECOMPILE_PARSER} "${Z_PRECOMPILE_PARAMS_PATH}" "${PARSER_INPUT}" "${PROJECT_ROOT_DIR}/source" ${sys_include} "ZEngineDemo" 0
+        COMMAND
+            ${CMAKE_COMMAND} -E touch ${PRECOMPILE_STAMP}
+    )
+endif()
 
 # Create target for reflection code generation
 add_custom_target(${PROJECT_PRECOMPILE_TARGET} ALL
@@ -54,3 +104,13 @@ add_custom_target(${PROJECT_PRECOMPILE_TARGET} ALL
     COMMENT "Meta parser code generation target for ZEngineDemo"
 )
 
+# ZParser is built before it runs; the project target already waits for this one.
+# A ZParser target not defined yet is still covered by the $<TARGET_FILE:ZParser>
+# dependency of the custom command
+if(TARGET ZParser)
+    get_target_property(ZPARSER_IMPORTED ZParser IMPORTED)
+    if(NOT ZPARSER_IMPORTED)
+        add_dependencies(${PROJECT_PRECOMPILE_TARGET} ZParser)
+    endif()
+endif()
+
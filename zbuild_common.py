@@ -0,0 +1,150 @@
+"""
+Lightweight parts of zbuild shared by the entry script and zbuild_core:
+terminal output and the client side of the daemon protocol.
+
+The entry script imports this module, and nothing heavier, to hand a
+command to a warm daemon, so it must stay cheap to import.
+"""
+
+import sys
+import os
+import socket
+import json
+from typing import Optional, List, Dict
+
+
+# Files whose edits make a running daemon stale
+SCRIPT_FILES = ("zbuild.py", "zbuild_common.py", "zbuild_core.py")
+
+
+class Colors:
+    """ANSI color codes for terminal output"""
+    HEADER = '\033[95m'
+    OKBLUE = '\033[94m'
+    OKCYAN = '\033[96m'
+    OKGREEN = '\033[92m'
+    WARNING = '\033[93m'
+    FAIL = '\033[91m'
+    ENDC = '\033[0m'
+    BOLD = '\033[1m'
+    UNDERLINE = '\033[4m'
+
+
+def print_info(message: str):
+    print(f"{Colors.OKCYAN}[INFO]{Colors.ENDC} {message}")
+
+
+def print_success(message: str):
+    print(f"{Colors.OKGREEN}[SUCCESS]{Colors.ENDC} {message}")
+
+
+def print_warning(message: str):
+    print(f"{Colors.WARNING}[WARNING]{Colors.ENDC} {message}")
+
+
+def print_error(message: str):
+    print(f"{Colors.FAIL}[ERROR]{Colors.ENDC} {message}")
+
+
+def print_header(message: str):
+    print(f"\n{Colors.BOLD}{Colors.HEADER}{'='*60}{Colors.ENDC}")
+    print(f"{Colors.BOLD}{Colors.HEADER}{message}{Colors.ENDC}")
+    print(f"{Colors.BOLD}{Colors.HEADER}{'='*60}{Colors.ENDC}\n")
+
+
+def daemon_supported() -> bool:
+    """The daemon hands the client's stdout/stderr over a Unix socket"""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def daemon_socket_path(root_dir) -> str:
+    """Location of the daemon socket for a project"""
+    path = os.path.join(root_dir, "build", ".zbuild", "daemon.sock")
+    # AF_UNIX paths are limited to ~108 bytes; fall back to a short temp path
+    if len(path) > 100:
+        import hashlib
+        import tempfile
+        digest = hashlib.sha1(str(root_dir).encode()).hexdigest()[:12]
+        path = os.path.join(tempfile.gettempdir(), f"zbuild-{digest}.sock")
+    return path
+
+
+def script_mtime() -> List[int]:
+    """Modification times of zbuild's own sources"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return [os.stat(os.path.join(directory, name)).st_mtime_ns for name in SCRIPT_FILES]
+
+
+def recv_message(conn: socket.socket, data: bytes = b"") -> Optional[dict]:
+    """Read one newline-terminated JSON message"""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+def daemon_request(root_dir, message: dict, pass_stdio: bool = False) -> Optional[dict]:
+    """Send a message to the daemon and return its reply
+    
+    Returns None only when the message never reached a daemon. If the daemon
+    goes away after that, the reply is {"lost": True}. Ctrl-C while waiting
+    asks the daemon to cancel the command and still waits for its reply.
+    """
+    path = daemon_socket_path(root_dir)
+    if not daemon_supported() or not os.path.exists(path):
+        return None
+    
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(path)
+            payload = json.dumps(message).encode() + b"\n"
+            if pass_stdio:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                socket.send_fds(conn, [payload], [sys.stdout.fileno(), sys.stderr.fileno()])
+            else:
+                conn.sendall(payload)
+        except OSError:
+            return None
+    
+        try:
+            try:
+                reply = recv_message(conn)
+            except KeyboardInterrupt:
+                print_warning("Interrupted, cancelling the command in the daemon...")
+                conn.sendall(json.dumps({"control": "interrupt"}).encode() + b"\n")
+                try:
+                    reply = recv_message(conn)
+                except KeyboardInterrupt:
+                    return {"exit": 130}
+        except (OSError, ValueError):
+            reply = None
+        return reply if reply is not None else {"lost": True}
+
+
+def forward_to_daemon(root_dir, argv: List[str]) -> Optional[int]:
+    """Run a command inside a warm daemon, returning its exit code
+    
+    Output goes straight to this process's stdout/stderr because the daemon
+    writes to the file descriptors we hand over. Returns None when no usable
+    daemon is running, in which case the caller runs the command itself.
+    """
+    if os.environ.get("ZBUILD_NO_DAEMON"):
+        return None
+    
+    reply: Optional[Dict] = daemon_request(root_dir, {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "script_mtime": script_mtime(),
+    }, pass_stdio=True)
+    if reply and reply.get("lost"):
+        # The command may have run partly; running it again here could
+        # clash with whatever the daemon left behind
+        print_error("Lost the connection to the zbuild daemon while it ran the command")
+        return 1
+    if not reply or "exit" not in reply:
+        return None
+    return reply["exit"]
@@ -0,0 +1,4501 @@
+"""
+Core of the ZEngineDemo build system: BuildSystem, the command line and the
+build daemon. Run it through zbuild.py, which hands commands to a warm daemon
+before paying for this module's imports.
+"""
+
+import argparse
+import subprocess
+import sys
+import os
+import platform
+import shutil
+import hashlib
+import time
+import socket
+import threading
+import signal
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple
+import json
+import re
+
+from zbuild_common import (print_info, print_success, print_warning, print_error, print_header,
+                           daemon_supported, daemon_socket_path, script_mtime, recv_message, daemon_request)
+
+
+# Entry script that child builds, the link launcher and the daemon are started through
+ZBUILD_SCRIPT = Path(__file__).with_name("zbuild.py").absolute()
+
+# Memory assumed per compile job until a build has been measured
+DEFAULT_JOB_MEMORY = 1 << 30
+# Fraction of available memory the build is allowed to plan for
+JOB_MEMORY_BUDGET = 0.9
+# Number of recorded per-build peak RSS samples kept for the job policy
+JOB_MEMORY_SAMPLES = 20
+# How many times a build killed by the OOM killer is resumed with fewer jobs
+MAX_OOM_RETRIES = 3
+
+# Number of zbuild phase timings kept for trace export
+PHASE_HISTORY = 50
+
+# State shared by every build tree of the project, kept in build/.zbuild
+SHARED_STATE = {"toolchain.json", "compilers.json", "job_memory.json", "build_dir.json", "matrix.json"}
+# Directories that never hold build inputs and are skipped when fingerprinting trees
+FINGERPRINT_SKIP_DIRS = {"build", "bin", "_generated", "__pycache__", "node_modules"}
+# Cache switches build flips in place; they are not inputs of a configure
+BUILD_MODE_OPTIONS = ("Z_TIME_TRACE", "Z_UNITY_BUILD")
+# Environment variables that change the outcome of a CMake configure
+CONFIGURE_ENV = ("CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS", "ZENGINE_ROOT")
+# Engine targets the project depends on; building them builds the rest of the engine it needs
+ENGINE_TARGETS = ["ZRuntime", "ZParser"]
+# Cache entries holding the flags engine outputs are built with, each also per build type
+ENGINE_FLAG_VARIABLES = ["CMAKE_C_FLAGS", "CMAKE_CXX_FLAGS", "CMAKE_SHARED_LINKER_FLAGS", "CMAKE_EXE_LINKER_FLAGS"]
+# Default size cap of the engine artifact store, overridable with ZENGINE_STORE_MAX_SIZE (GiB)
+ENGINE_STORE_MAX_SIZE = 20 << 30
+# Assumed peak RSS of a link until the link launcher has measured one
+DEFAULT_LINK_MEMORY = 2 << 30
+# Links run beside compiles, so the link pool is sized from this share of memory
+LINK_MEMORY_SHARE = 0.5
+# Link memory samples kept per build tree
+LINK_MEMORY_SAMPLES = 50
+
+# Fewest headers worth a ZParser process of their own
+PRECOMPILE_SHARD_MIN_HEADERS = 8
+
+# Outputs of compile edges, including the precompiled header itself
+OBJECT_SUFFIXES = (".o", ".obj", ".gch", ".pch")
+# Assumed compile time of a source with no recorded timing yet
+UNITY_DEFAULT_SECONDS = 1.0
+# Builds a source must go without edits before it rejoins the unity batches
+UNITY_HOT_BUILDS = 3
+
+
+def read_pressure(resource: str) -> Optional[float]:
+    """Return the 10s 'some' pressure-stall percentage for cpu/memory/io, if available"""
+    try:
+        with open(f"/proc/pressure/{resource}", "r") as f:
+            for line in f:
+                if line.startswith("some "):
+                    fields = dict(item.split("=", 1) for item in line.split()[1:])
+                    return float(fields["avg10"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+class Jobserver:
+    """FIFO-based GNU make jobserver hosted by zbuild
+    
+    make (4.4+), ninja (1.13+) and anything else launched by the build that
+    honours MAKEFLAGS draw from the same token pool. A monitor thread grows
+    and shrinks the pool from Linux pressure-stall information: free tokens
+    are withheld while memory or CPU is under pressure and handed back once
+    it eases.
+    """
+    
+    INTERVAL = 1.0
+    MEMORY_HIGH = 10.0
+    MEMORY_LOW = 1.0
+    CPU_HIGH = 60.0
+    CPU_LOW = 20.0
+    
+    def __init__(self, jobs: int, max_jobs: int):
+        self.max_jobs = max(1, max_jobs)
+        self.target = max(1, min(jobs, self.max_jobs))
+        import tempfile
+        self.dir = tempfile.mkdtemp(prefix="zbuild-jobserver-")
+        self.path = os.path.join(self.dir, "fifo")
+        os.mkfifo(self.path, 0o600)
+        # Opened read-write so writes never block and readers never see EOF
+        self.fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+        # Every client owns one implicit token, so the pool holds target - 1
+        self.pool = 0
+        self.adjustments: List[dict] = []
+        self._stop = threading.Event()
+        self._sync_pool()
+        self._thread = threading.Thread(target=self._monitor, name="zbuild-jobserver", daemon=True)
+        self._thread.start()
+    
+    def makeflags(self, existing: str = "") -> str:
+        """MAKEFLAGS value that points clients at this jobserver"""
+        return f"{existing} -j{self.target} --jobserver-auth=fifo:{self.path}".strip()
+    
+    def _sync_pool(self):
+        """Move the pool towards target - 1 tokens; tokens in use are reclaimed later"""
+        wanted = self.target - 1
+        if self.pool < wanted:
+            self.pool += os.write(self.fd, b"+" * (wanted - self.pool))
+        elif self.pool > wanted:
+            try:
+                self.pool -= len(os.read(self.fd, self.pool - wanted))
+            except BlockingIOError:
+                pass
+    
+    def _monitor(self):
+        while not self._stop.wait(self.INTERVAL):
+            memory = read_pressure("memory")
+            cpu = read_pressure("cpu")
+            target = self.target
+            if memory is not None and memory > self.MEMORY_HIGH:
+                target = max(1, target - max(1, target // 4))
+                reason = f"memory pressure {memory:.1f}%"
+            elif cpu is not None and cpu > self.CPU_HIGH:
+                target = max(1, target - 1)
+                reason = f"cpu pressure {cpu:.1f}%"
+            elif (memory is not None or cpu is not None) and \
+                    (memory or 0.0) < self.MEMORY_LOW and (cpu or 0.0) < self.CPU_LOW:
+                target = min(self.max_jobs, target + 1)
+                reason = "pressure eased"
+            
+            if target != self.target:
+                self.adjustments.append({"time": time.time(), "from": self.target,
+                                         "to": target, "reason": reason})
+                print_info(f"Jobserver: {self.target} -> {target} jobs ({reason})")
+                self.target = target
+            self._sync_pool()
+    
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self.fd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class EngineLock:
+    """Reader-writer lock on the engine outputs that several projects share
+    
+    Project builds hold the lock shared, so any number of them run in
+    parallel while no engine rebuild can replace outputs under them. A
+    project that needs to rebuild the engine takes it exclusively and
+    downgrades it again afterwards. Windows only has exclusive locks, so
+    there the lock is released instead of downgraded.
+    """
+    
+    POLL = 0.5
+    
+    def __init__(self, path: Path, holder: Optional[str] = None):
+        self.path = path
+        self.holder = holder
+        self.fd: Optional[int] = None
+        self.exclusive = False
+    
+    def _try_lock(self, exclusive: bool) -> bool:
+        if os.name == "nt":
+            import msvcrt
+            try:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+            except OSError:
+                return False
+            return True
+        import fcntl
+        # POSIX record locks, unlike flock(), convert between modes atomically
+        try:
+            fcntl.lockf(self.fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+    
+    def acquire(self, exclusive: bool = True):
+        """Take or convert the lock, waiting for other projects if necessary"""
+        if os.name == "nt" and not exclusive:
+            self.release()
+            return
+        if exclusive and self.fd is not None and not self.exclusive:
+            # Two readers upgrading at once would wait on each other forever
+            self.release()
+        self.exclusive = exclusive
+        if self.fd is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        if self._try_lock(exclusive):
+            return
+        holder = self.holder or f"another project {'using' if exclusive else 'building'} the shared engine"
+        print_info(f"Waiting for {holder} ({self.path})...")
+        while not self._try_lock(exclusive):
+            time.sleep(self.POLL)
+    
+    def release(self):
+        if self.fd is not None:
+            # Closing the descriptor drops the lock
+            os.close(self.fd)
+            self.fd = None
+
+
+def parse_ninja_log(path: Path) -> List[List[dict]]:
+    """Split .ninja_log into one edge list per ninja run
+    
+    Each edge is {"start", "end" (ms since that ninja run started), "outputs"}.
+    A new run is detected where end times go backwards, as ninja appends
+    entries in completion order.
+    """
+    runs: List[List[dict]] = []
+    edges: Dict[tuple, dict] = {}
+    last_end = -1
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 5:
+                    continue
+                start, end = int(fields[0]), int(fields[1])
+                if end < last_end:
+                    runs.append(list(edges.values()))
+                    edges = {}
+                last_end = end
+                # Edges with several outputs log one line per output
+                key = (start, end, fields[4])
+                if key in edges:
+                    edges[key]["outputs"].append(fields[3])
+                else:
+                    edges[key] = {"start": start, "end": end, "outputs": [fields[3]]}
+    except (OSError, ValueError):
+        return runs
+    if edges:
+        runs.append(list(edges.values()))
+    return runs
+
+
+def parse_ninja_deps(text: str) -> Dict[str, List[str]]:
+    """Map every output listed by `ninja -t deps` to the dependencies recorded for it"""
+    deps: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    for line in text.splitlines():
+        if not line.strip():
+            current = None
+        elif line[0].isspace():
+            if current is not None:
+                current.append(line.strip())
+        elif ": #deps" in line:
+            current = deps.setdefault(line.split(": #deps", 1)[0], [])
+    return deps
+
+
+def parse_depfile(text: str) -> Dict[str, List[str]]:
+    """Map the targets of a Makefile-style depfile (as written by -MD) to their prerequisites"""
+    deps: Dict[str, List[str]] = {}
+    for line in text.replace("\\\n", " ").splitlines():
+        target, separator, prerequisites = line.partition(": ")
+        if separator:
+            deps.setdefault(target.strip(), []).extend(prerequisites.split())
+    return deps
+
+
+def parse_ninja_graph(dot: str) -> Dict[str, List[str]]:
+    """Map every output of `ninja -t graph` to the inputs of the edge that produces it"""
+    node_re = re.compile(r'^"(0x[0-9a-f]+)" \[label="(.*?)"(, shape=ellipse)?')
+    arrow_re = re.compile(r'^"(0x[0-9a-f]+)" -> "(0x[0-9a-f]+)"(?: \[(.*)\])?')
+    labels: Dict[str, str] = {}
+    ellipses = set()
+    arrows = []
+    for line in dot.splitlines():
+        line = line.strip()
+        match = arrow_re.match(line)
+        if match:
+            arrows.append(match.groups())
+            continue
+        match = node_re.match(line)
+        if match:
+            labels[match.group(1)] = match.group(2)
+            if match.group(3):
+                ellipses.add(match.group(1))
+    
+    # Edges with one input and one output are drawn as a single labelled
+    # arrow; all others get an ellipse node between inputs and outputs
+    edge_inputs: Dict[str, List[str]] = {}
+    edge_outputs: Dict[str, List[str]] = {}
+    inputs_of: Dict[str, List[str]] = {}
+    for source, target, attributes in arrows:
+        if target in ellipses:
+            edge_inputs.setdefault(target, []).append(labels.get(source, source))
+        elif source in ellipses:
+            edge_outputs.setdefault(source, []).append(labels.get(target, target))
+        else:
+            inputs_of.setdefault(labels.get(target, target), []).append(labels.get(source, source))
+    for edge, outputs in edge_outputs.items():
+        for output in outputs:
+            inputs_of.setdefault(output, []).extend(edge_inputs.get(edge, []))
+    return inputs_of
+
+
+def edge_target(output: str) -> str:
+    """Best-effort CMake target name for a native build edge output"""
+    if ".precompile_stamp" in output or "meta parser" in output.lower():
+        return "precompile"
+    match = re.search(r"CMakeFiles/([^/]+)\.dir/", output)
+    if match:
+        return match.group(1)
+    # Make steps are progress messages such as "Linking CXX shared library libX.so"
+    name = os.path.basename(output.split()[-1]) if output.strip() else output
+    if name.startswith("lib"):
+        name = name[3:]
+    return name.split(".", 1)[0] or output
+
+
+def summarize_time_trace(path: str) -> Optional[dict]:
+    """Condense one clang -ftime-trace file; runs in a worker process"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or "traceEvents" not in data:
+        return None
+    
+    headers: Dict[str, List[float]] = {}
+    templates: Dict[str, List[float]] = {}
+    totals = {"ExecuteCompiler": 0.0, "Frontend": 0.0, "Backend": 0.0}
+    for event in data["traceEvents"]:
+        if event.get("ph") != "X":
+            continue
+        name = event.get("name")
+        duration = event.get("dur", 0) / 1e6
+        if name in totals:
+            totals[name] += duration
+            continue
+        detail = event.get("args", {}).get("detail")
+        if not detail:
+            continue
+        if name == "Source":
+            bucket = headers
+        elif name in ("InstantiateClass", "InstantiateFunction"):
+            bucket = templates
+        else:
+            continue
+        entry = bucket.setdefault(detail, [0.0, 0])
+        entry[0] += duration
+        entry[1] += 1
+    
+    return {
+        "path": path,
+        "total": totals["ExecuteCompiler"],
+        "frontend": totals["Frontend"],
+        "backend": totals["Backend"],
+        "headers": headers,
+        "templates": templates,
+    }
+
+
+# CMake commands whose first argument tells apart very different costs
+PROFILE_SPLIT_COMMANDS = {"file", "find_package", "try_compile"}
+# CMake commands that are keyed by the file they enter
+PROFILE_ENTER_COMMANDS = {"include", "add_subdirectory"}
+
+
+def summarize_cmake_profile(path: Path) -> Optional[dict]:
+    """Condense a cmake --profiling-format=google-trace file into per-command and per-file times
+    
+    Self time excludes nested commands. Inclusive time counts recursive
+    calls of the same command, or re-entries of the same file, only once.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            events = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(events, list) or not events:
+        return None
+    
+    commands: Dict[str, dict] = {}
+    files: Dict[str, dict] = {}
+    calls: List[dict] = []
+    stack: List[dict] = []
+    for event in events:
+        if event.get("ph") == "B":
+            args = event.get("args", {})
+            name = event.get("name", "?")
+            location = args.get("location", "")
+            file_name = location.rsplit(":", 1)[0]
+            key = name
+            if name in PROFILE_SPLIT_COMMANDS:
+                first = (args.get("functionArgs") or "").split(" ", 1)[0]
+                if first:
+                    key = f"{name}({first})"
+            # Arguments are recorded unexpanded, so name include() and
+            # add_subdirectory() after the first file they run commands from
+            if stack and stack[-1]["name"] in PROFILE_ENTER_COMMANDS and not stack[-1]["entered"]:
+                stack[-1]["entered"] = True
+                stack[-1]["key"] = f"{stack[-1]['name']}({file_name})"
+            stack.append({"name": name, "key": key, "entered": False, "file": file_name,
+                          "location": location, "args": args.get("functionArgs", ""),
+                          "start": event["ts"], "children": 0})
+        elif event.get("ph") == "E" and stack:
+            call = stack.pop()
+            inclusive = (event["ts"] - call["start"]) / 1e6
+            self_time = inclusive - call["children"]
+            if stack:
+                stack[-1]["children"] += inclusive
+            
+            command = commands.setdefault(call["key"], {"name": call["key"], "count": 0,
+                                                        "self": 0.0, "inclusive": 0.0})
+            command["count"] += 1
+            command["self"] += self_time
+            if all(outer["key"] != call["key"] for outer in stack):
+                command["inclusive"] += inclusive
+            
+            entry = files.setdefault(call["file"], {"name": call["file"], "count": 0,
+                                                    "self": 0.0, "inclusive": 0.0})
+            entry["count"] += 1
+            entry["self"] += self_time
+            if all(outer["file"] != call["file"] for outer in stack):
+                entry["inclusive"] += inclusive
+            
+            calls.append({"name": call["key"], "location": call["location"], "args": call["args"][:120],
+                          "seconds": inclusive, "self": self_time})
+    
+    timestamps = [event["ts"] for event in events if "ts" in event]
+    by_self = lambda row: -row["self"]
+    return {
+        "total": (max(timestamps) - min(timestamps)) / 1e6,
+        "commands": sorted(commands.values(), key=by_self),
+        "files": sorted(files.values(), key=by_self),
+        "calls": sorted(calls, key=lambda row: -row["self"])[:200],
+    }
+
+
+# Compiler flags dropped when re-running a compile command as a preprocessor pass
+PREPROCESS_DROP_FLAGS = {"-c", "-MD", "-MMD", "-ftime-trace", "-Winvalid-pch"}
+PREPROCESS_DROP_FLAGS_WITH_VALUE = {"-o", "-MF", "-MT", "-MQ"}
+
+
+def strip_pch_arguments(arguments: List[str]) -> List[str]:
+    """Drop the flags force-including a CMake precompiled header
+    
+    GCC gets `-include .../cmake_pch.hxx`; Clang additionally gets
+    `-Xclang -include-pch -Xclang <pch>` and the same -include through
+    -Xclang. Left in, the PCH headers vanish from the measured include tree.
+    """
+    def is_pch(flag: str, value: str) -> bool:
+        return flag == "-include-pch" or (flag == "-include" and "cmake_pch" in Path(value).name)
+    
+    result = []
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        rest = arguments[index + 1:]
+        if len(rest) >= 3 and argument == "-Xclang" and rest[1] == "-Xclang" and is_pch(rest[0], rest[2]):
+            index += 4
+        elif len(rest) >= 1 and is_pch(argument, rest[0]):
+            index += 2
+        else:
+            result.append(argument)
+            index += 1
+    return result
+
+
+def preprocess_translation_unit(entry: dict) -> Optional[dict]:
+    """Preprocess one compile_commands.json entry and measure its includes
+    
+    Runs in a worker process. Linemarkers in the -E output give both the
+    include tree and, for every header, the preprocessed bytes it pulls in
+    (itself plus everything it includes).
+    """
+    directory = entry.get("directory", ".")
+    import shlex
+    arguments = entry.get("arguments") or shlex.split(entry.get("command", ""))
+    if not arguments or Path(arguments[0]).stem.lower() in ("cl", "clang-cl"):
+        return None
+    
+    cmd = [arguments[0]]
+    skip = False
+    for argument in strip_pch_arguments(arguments[1:]):
+        if skip:
+            skip = False
+        elif argument in PREPROCESS_DROP_FLAGS_WITH_VALUE:
+            skip = True
+        elif argument in PREPROCESS_DROP_FLAGS or argument.startswith(("-o", "-MF")):
+            continue
+        else:
+            cmd.append(argument)
+    cmd.extend(["-E", "-o", "-"])
+    
+    try:
+        result = subprocess.run(cmd, cwd=directory, capture_output=True)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    
+    marker = re.compile(rb'^# (\d+) "(.*)"((?: \d)*)$')
+    inclusive: Dict[str, int] = {}
+    parents: Dict[str, str] = {}
+    order: List[str] = []
+    system = set()
+    stack: List[Tuple[str, int]] = []
+    offset = 0
+    for line in result.stdout.splitlines(keepends=True):
+        if not line.startswith(b"# "):
+            offset += len(line)
+            continue
+        match = marker.match(line.rstrip(b"\r\n"))
+        if not match:
+            offset += len(line)
+            continue
+        name = match.group(2).decode(errors="replace")
+        flags = match.group(3).split()
+        # Pseudo files such as <built-in> are never entered, only returned to
+        pseudo = name.startswith("<")
+        path = name if pseudo else os.path.normpath(os.path.join(directory, name))
+        if not stack:
+            if not pseudo:
+                stack.append((path, offset))
+        elif b"1" in flags and not pseudo:
+            if path not in parents:
+                parents[path] = stack[-1][0]
+                order.append(path)
+            if b"3" in flags:
+                system.add(path)
+            stack.append((path, offset))
+        elif b"2" in flags:
+            while len(stack) > 1 and stack[-1][0] != path:
+                header, start = stack.pop()
+                inclusive[header] = inclusive.get(header, 0) + offset - start
+    while len(stack) > 1:
+        header, start = stack.pop()
+        inclusive[header] = inclusive.get(header, 0) + offset - start
+    
+    return {
+        "file": os.path.normpath(os.path.join(directory, entry.get("file", ""))),
+        "bytes": offset,
+        "headers": inclusive,
+        "parents": parents,
+        "order": order,
+        "system": sorted(system),
+    }
+
+
+def assign_slots(edges: List[dict]) -> List[int]:
+    """Place overlapping edges on the lowest free parallel slot, like a job pool would"""
+    slot_ends: List[float] = []
+    slots = [0] * len(edges)
+    for index in sorted(range(len(edges)), key=lambda i: (edges[i]["start"], edges[i]["end"])):
+        edge = edges[index]
+        for slot, slot_end in enumerate(slot_ends):
+            if slot_end <= edge["start"]:
+                break
+        else:
+            slot = len(slot_ends)
+            slot_ends.append(0.0)
+        slot_ends[slot] = edge["end"]
+        slots[index] = slot
+    return slots
+
+
+class MakeOutputTimer:
+    """Reconstructs job timings from CMake-generated Makefile output
+    
+    Make does not log timings, so a job starts when its progress line is
+    printed. Compiles end at their object file's mtime; other steps
+    (links, custom commands) end at the next "Built target" line.
+    """
+    
+    PROGRESS = re.compile(r"^\[\s*\d+%\] (.*)$")
+    ANSI = re.compile(r"\x1b\[[0-9;]*m")
+    
+    def __init__(self, build_dir: Path):
+        self.build_dir = build_dir
+        self.compiles: List[dict] = []
+        self.steps: List[dict] = []
+        self.open_steps: List[dict] = []
+    
+    def on_line(self, line: str, timestamp: float):
+        match = self.PROGRESS.match(self.ANSI.sub("", line).strip())
+        if not match:
+            return
+        message = match.group(1)
+        if message.startswith("Building ") and " object " in message:
+            self.compiles.append({"name": message.split(" object ", 1)[1], "start": timestamp})
+        elif message.startswith("Built target "):
+            if self.open_steps:
+                step = self.open_steps.pop(0)
+                step["end"] = timestamp
+                self.steps.append(step)
+        else:
+            self.open_steps.append({"name": message, "start": timestamp})
+    
+    def edges(self) -> List[dict]:
+        edges = []
+        for compile_job in self.compiles:
+            try:
+                end = (self.build_dir / compile_job["name"]).stat().st_mtime
+            except OSError:
+                continue
+            if end >= compile_job["start"]:
+                edges.append({"start": compile_job["start"], "end": end,
+                              "outputs": [compile_job["name"]]})
+        for step in self.steps:
+            edges.append({"start": step["start"], "end": step["end"], "outputs": [step["name"]]})
+        return edges
+
+
+class ChildBuild:
+    """A child zbuild whose output is prefixed with its label
+    
+    The output is also watched for the first link step of a project target,
+    which marks the point where the build stops saturating the CPU. Engine
+    links are followed by the project's compiles, so they do not count.
+    """
+    
+    LINKING = re.compile(r"\bLinking (?:C|CXX) ")
+    
+    def __init__(self, label: str, cmd: List[str], cwd: Path, env: Dict[str, str],
+                 output_lock: threading.Lock):
+        self.label = label
+        self.output_lock = output_lock
+        self.start = time.time()
+        self.link_start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.returncode: Optional[int] = None
+        self.process = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, text=True, errors="replace")
+        self._thread = threading.Thread(target=self._pump, name=f"zbuild-{label}", daemon=True)
+        self._thread.start()
+    
+    def _pump(self):
+        for line in self.process.stdout:
+            if self.link_start is None and self.LINKING.search(line) \
+                    and not any(name in line for name in ENGINE_TARGETS):
+                self.link_start = time.time()
+            with self.output_lock:
+                sys.stdout.write(f"[{self.label}] {line}")
+                sys.stdout.flush()
+        self.returncode = self.process.wait()
+        self.end = time.time()
+    
+    @property
+    def done(self) -> bool:
+        return self.end is not None
+    
+    @property
+    def linking(self) -> bool:
+        return self.link_start is not None
+    
+    def wait(self) -> int:
+        self._thread.join()
+        return self.returncode
+    
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+
+def run_link_launcher(record: Path, command: List[str]) -> int:
+    """Run a link command on behalf of CMake and record its duration and peak RSS
+    
+    Installed as CMAKE_<LANG>_LINKER_LAUNCHER. Samples are appended to a JSON
+    lines file, one short write per link, so concurrent links do not clash.
+    """
+    if not command:
+        print_error("link-launcher needs a link command")
+        return 2
+    start = time.time()
+    returncode = subprocess.call(command)
+    end = time.time()
+    
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        peak_rss = peak_rss if sys.platform == "darwin" else peak_rss * 1024
+    except ImportError:
+        peak_rss = None
+    
+    output = command[command.index("-o") + 1] if "-o" in command[:-1] else \
+        next((arg[5:] for arg in command if arg.upper().startswith("/OUT:")), "")
+    sample = {"output": output, "start": start, "end": end, "peak_rss": peak_rss, "returncode": returncode}
+    try:
+        record.parent.mkdir(parents=True, exist_ok=True)
+        with open(record, "a", encoding="utf-8") as f:
+            f.write(json.dumps(sample) + "\n")
+    except OSError:
+        pass
+    return returncode
+
+
+INCLUDE_DIRECTIVE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*["<]([^">]+)[">]', re.MULTILINE)
+
+
+REFLECTION_MARKER = re.compile(rb"\b(?:REFLECTION_TYPE|CLASS|META)\s*\(")
+
+
+def scan_reflection_markers(path: str, verdicts: Dict[str, bool]) -> Tuple[Optional[str], bool]:
+    """Content hash of a header and whether it contains a reflection macro ZParser would act on
+    
+    Both come from one pass over the mapped file; the search is skipped
+    when verdicts already holds one for the hash.
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return hashlib.sha256(b"").hexdigest(), False
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest = hashlib.sha256(data).hexdigest()
+                verdict = verdicts.get(digest)
+                if verdict is None:
+                    verdict = REFLECTION_MARKER.search(data) is not None
+                return digest, verdict
+    except (OSError, ValueError):
+        # Unreadable here; let ZParser decide
+        return None, True
+
+
+# Lines that declare a type or carry a reflection macro
+REFLECTION_SHAPE = re.compile(rb"^.*(?:\b(?:REFLECTION_TYPE|CLASS|META)\s*\(|\b(?:class|struct|enum)\s+\w).*$",
+                              re.MULTILINE)
+
+
+def reflection_signature(path: str) -> Optional[str]:
+    """Hash of a header's type declarations and reflection macros, ignoring whitespace
+    
+    The aggregate files ZParser writes (registration lists, include lists)
+    are taken to depend on a header only through these lines.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    digest = hashlib.sha256()
+    for line in REFLECTION_SHAPE.findall(data):
+        digest.update(b" ".join(line.split()) + b"\n")
+    return digest.hexdigest()
+
+
+def header_closure_hashes(headers: List[str], include_dirs: List[Path]) -> Tuple[Dict[str, str], List[str]]:
+    """Hash every header together with all headers it includes, directly or not
+    
+    Includes are resolved against the including file's directory and then
+    include_dirs; anything that does not resolve (system headers) is ignored.
+    Also returns every file read, the inputs of the hashes.
+    """
+    files: Dict[str, Tuple[str, List[str]]] = {}
+    
+    def scan(path: str) -> Tuple[str, List[str]]:
+        if path not in files:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                files[path] = ("", [])
+                return files[path]
+            includes = []
+            for name in INCLUDE_DIRECTIVE.findall(data.decode("utf-8", "replace")):
+                for base in [Path(path).parent, *include_dirs]:
+                    candidate = base / name
+                    if candidate.is_file():
+                        includes.append(os.path.normpath(candidate))
+                        break
+            files[path] = (hashlib.sha256(data).hexdigest(), includes)
+        return files[path]
+    
+    hashes = {}
+    for header in headers:
+        seen = set()
+        pending = [os.path.normpath(header)]
+        while pending:
+            path = pending.pop()
+            if path not in seen:
+                seen.add(path)
+                pending.extend(scan(path)[1])
+        digest = hashlib.sha256()
+        for path in sorted(seen):
+            digest.update(f"{path}\0{files[path][0]}\n".encode())
+        hashes[header] = digest.hexdigest()
+    return hashes, sorted(path for path, (content, _) in files.items() if content)
+
+
+def write_depfile(path: Path, target: Path, dependencies: List[str]):
+    """Write a Makefile-style depfile, as read by Ninja and CMake's DEPFILE"""
+    def escape(name: str) -> str:
+        return Path(name).as_posix().replace(" ", "\\ ").replace("#", "\\#")
+    
+    lines = [f"{escape(str(target))}:"] + [f" {escape(name)}" for name in dependencies]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" \\\n".join(lines) + "\n")
+
+
+def merge_shard_lines(shards: List[List[str]]) -> List[str]:
+    """Merge a file that several ZParser shards each wrote for their own headers
+    
+    The lines every shard starts and ends with (include guards, pragmas)
+    are kept once; what lies between is each shard's contribution, joined
+    in shard order. Shards hold consecutive runs of the header list, so
+    the result lists headers in the same order as a single parse would.
+    """
+    if not shards:
+        return []
+    shortest = min(len(lines) for lines in shards)
+    prefix = 0
+    while prefix < shortest and all(lines[prefix] == shards[0][prefix] for lines in shards):
+        prefix += 1
+    suffix = 0
+    while prefix + suffix < shortest and all(lines[-1 - suffix] == shards[0][-1 - suffix] for lines in shards):
+        suffix += 1
+    merged = shards[0][:prefix]
+    for lines in shards:
+        merged.extend(lines[prefix:len(lines) - suffix])
+    return merged + shards[0][len(shards[0]) - suffix:]
+
+
+def read_git_revision(repo: Path) -> Optional[str]:
+    """Commit checked out in a git work tree, read from .git without spawning git"""
+    git_dir = repo / ".git"
+    try:
+        if git_dir.is_file():
+            # Worktrees and submodules point at their real git directory
+            git_dir = (repo / git_dir.read_text().split(":", 1)[1].strip()).resolve()
+        head = (git_dir / "HEAD").read_text().strip()
+    except (OSError, IndexError):
+        return None
+    if not head.startswith("ref:"):
+        return head
+    ref = head[4:].strip()
+    common_dir = git_dir
+    try:
+        common_dir = (git_dir / (git_dir / "commondir").read_text().strip()).resolve()
+    except OSError:
+        pass
+    for directory in (git_dir, common_dir):
+        try:
+            return (directory / ref).read_text().strip()
+        except OSError:
+            pass
+    try:
+        with open(common_dir / "packed-refs", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except OSError:
+        pass
+    return None
+
+
+class ArtifactStore:
+    """Content-addressed store of build outputs
+    
+    Files are kept once per content under objects/, read-only, and every
+    entry under entries/ maps relative paths to them. Entries are
+    materialised as copies (reflinks where the filesystem supports them),
+    never as links, so a tool rewriting an output in place cannot corrupt
+    the stored object. Entries unused for longest are evicted when the store
+    exceeds its cap; eviction holds the store lock exclusively while
+    publishing and materialising hold it shared.
+    """
+    
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects = root / "objects"
+        self.entries = root / "entries"
+    
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+    
+    def _entry_path(self, key: str) -> Path:
+        return self.entries / f"{key}.json"
+    
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _save(self, key: str, entry: dict):
+        self.entries.mkdir(parents=True, exist_ok=True)
+        import tempfile
+        fd, tmp = tempfile.mkstemp(dir=self.entries, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._entry_path(key))
+    
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        # Windows has no shared locks, so every holder takes it exclusively there
+        lock = EngineLock(self.root / ".lock", "another build using the engine store")
+        lock.acquire(exclusive or os.name == "nt")
+        try:
+            yield
+        finally:
+            lock.release()
+    
+    @staticmethod
+    def _copy(source: Path, dest: Path):
+        """Atomically replace dest with a copy of source, cloned where the filesystem allows"""
+        tmp = dest.with_name(f".{dest.name}.zbuild-tmp")
+        try:
+            with open(source, "rb") as src, open(tmp, "wb") as dst:
+                try:
+                    import fcntl
+                    # FICLONE: share the extents copy-on-write on btrfs, XFS and the like
+                    fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())
+                except (ImportError, OSError):
+                    shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(tmp, dest)
+        except BaseException:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            raise
+    
+    def publish(self, key: str, directory: Path, info: dict) -> int:
+        """Store every file below directory under key; returns the number of new objects
+        
+        Files whose size and mtime match the previous entry are not hashed
+        again. The outputs themselves are left alone.
+        """
+        with self._locked(exclusive=False):
+            previous = (self.load(key) or {}).get("files", {})
+            files: Dict[str, dict] = {}
+            links: Dict[str, str] = {}
+            added = 0
+            for path in sorted(directory.rglob("*")):
+                relative = path.relative_to(directory).as_posix()
+                if path.is_symlink():
+                    links[relative] = os.readlink(path)
+                    continue
+                # Dotfiles are zbuild's own temporaries and locks, not outputs
+                if not path.is_file() or path.name.startswith("."):
+                    continue
+                stat = path.stat()
+                known = previous.get(relative)
+                if (known and known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns
+                        and self._object_path(known["hash"]).exists()):
+                    files[relative] = known
+                    continue
+                digest = self._hash_file(path)
+                target = self._object_path(digest)
+                if not target.exists():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = target.with_name(f".{digest}.tmp")
+                    shutil.copy2(path, tmp)
+                    os.chmod(tmp, os.stat(tmp).st_mode & ~0o222)
+                    os.replace(tmp, target)
+                    added += 1
+                files[relative] = {"hash": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                   "executable": os.access(path, os.X_OK)}
+            self._save(key, {**info, "files": files, "links": links, "last_used": time.time()})
+        return added
+    
+    def materialize(self, key: str, directory: Path) -> Optional[int]:
+        """Make directory hold the files of an entry; returns how many had to be copied
+        
+        Returns None without touching directory when the entry or any of its
+        objects is missing, so a half-evicted entry never leaves outputs of
+        two builds mixed.
+        """
+        with self._locked(exclusive=False):
+            entry = self.load(key)
+            if not entry or not all(self._object_path(info["hash"]).is_file()
+                                    for info in entry["files"].values()):
+                return None
+            return self._materialize(key, entry, directory)
+    
+    def _materialize(self, key: str, entry: dict, directory: Path) -> int:
+        copied = 0
+        for relative, info in entry["files"].items():
+            dest = directory / relative
+            try:
+                stat = dest.stat()
+                if stat.st_size == info["size"] and stat.st_mtime_ns == info.get("mtime_ns"):
+                    continue
+            except OSError:
+                pass
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            self._copy(self._object_path(info["hash"]), dest)
+            os.chmod(dest, 0o755 if info.get("executable") else 0o644)
+            if info.get("mtime_ns"):
+                # The build tool judges outputs by mtime, so restore the one the build left
+                os.utime(dest, ns=(info["mtime_ns"], info["mtime_ns"]))
+            copied += 1
+        for relative, target in entry.get("links", {}).items():
+            dest = directory / relative
+            if os.path.islink(dest) and os.readlink(dest) == target:
+                continue
+            if dest.exists() or os.path.islink(dest):
+                dest.unlink()
+            os.symlink(target, dest)
+            copied += 1
+        entry["last_used"] = time.time()
+        self._save(key, entry)
+        return copied
+    
+    def all_entries(self) -> List[Tuple[str, dict]]:
+        result = []
+        for path in sorted(self.entries.glob("*.json")) if self.entries.exists() else []:
+            entry = self.load(path.stem)
+            if entry:
+                result.append((path.stem, entry))
+        return result
+    
+    def evict(self, max_bytes: int) -> Tuple[int, int]:
+        """Drop least recently used entries until the objects fit max_bytes
+        
+        Returns (entries removed, bytes freed).
+        """
+        with self._locked(exclusive=True):
+            return self._evict(max_bytes)
+    
+    def _evict(self, max_bytes: int) -> Tuple[int, int]:
+        entries = sorted(self.all_entries(), key=lambda item: item[1].get("last_used", 0))
+        sizes = {info["hash"]: info["size"] for _, entry in entries for info in entry["files"].values()}
+        referenced = {info["hash"]: 0 for _, entry in entries for info in entry["files"].values()}
+        for _, entry in entries:
+            for info in entry["files"].values():
+                referenced[info["hash"]] += 1
+        
+        total = sum(sizes.values())
+        removed = 0
+        while entries and total > max_bytes:
+            key, entry = entries.pop(0)
+            self._entry_path(key).unlink()
+            removed += 1
+            for info in entry["files"].values():
+                referenced[info["hash"]] -= 1
+                if referenced[info["hash"]] == 0:
+                    total -= sizes[info["hash"]]
+        
+        # Objects no entry refers to any more, including ones left by removed entries
+        freed = 0
+        live = {digest for digest, count in referenced.items() if count > 0}
+        if self.objects.exists():
+            for path in self.objects.glob("*/*"):
+                if path.name not in live and not path.name.endswith(".tmp"):
+                    try:
+                        freed += path.stat().st_size
+                        path.unlink()
+                    except OSError:
+                        pass
+        return removed, freed
+
+
+class BuildSystem:
+    """Main build system class"""
+    
+    def __init__(self, root_dir: Optional[Path] = None):
+        self.root_dir = root_dir or Path(__file__).parent.absolute()
+        # Each configure preset has its own tree below build_root; build_dir
+        # is the one the current command works on
+        self.build_root = self.root_dir / "build"
+        self.build_dir = self.build_root
+        self.system = platform.system()
+        self.is_windows = self.system == "Windows"
+        self.is_linux = self.system == "Linux"
+        self.is_macos = self.system == "Darwin"
+        # In-memory caches; they only pay off when the instance is kept warm by the daemon
+        self._state_memo: Dict[Path, tuple] = {}
+        self._presets_memo: Optional[tuple] = None
+        # Files written and left untouched by _write_if_changed since the last report
+        self._codegen_counts = {"written": 0, "unchanged": 0}
+        self._codegen_untouched: List[Path] = []
+        
+    def _state_path(self, name: str) -> Path:
+        """Path of a zbuild state file kept under the build directory"""
+        if name in SHARED_STATE:
+            return self.build_root / ".zbuild" / name
+        return self.build_dir / ".zbuild" / name
+    
+    def _load_state(self, name: str) -> Optional[dict]:
+        """Load a JSON state file, returning None if it is missing or unreadable"""
+        path = self._state_path(name)
+        try:
+            mtime = path.stat().st_mtime_ns
+            memo = self._state_memo.get(path)
+            if memo and memo[0] == mtime:
+                return memo[1]
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._state_memo[path] = (mtime, data)
+        return data
+    
+    def _save_state(self, name: str, data: dict):
+        """Atomically write a JSON state file"""
+        path = self._state_path(name)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print_warning(f"Failed to write {path}: {e}")
+    
+    def _write_if_changed(self, path: Path, content: str) -> bool:
+        """Write a generated file unless it already holds the same content
+        
+        An untouched file keeps its mtime, so nothing that depends on it is
+        rebuilt. Returns whether the file was written.
+        """
+        data = content.encode("utf-8")
+        try:
+            if path.stat().st_size == len(data):
+                with open(path, "rb") as f:
+                    if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                        self._codegen_counts["unchanged"] += 1
+                        self._codegen_untouched.append(path)
+                        return False
+        except OSError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            raise
+        self._codegen_counts["written"] += 1
+        return True
+    
+    def _compiled_dependencies(self) -> Dict[str, List[str]]:
+        """Dependencies the compiler reported for each object of the last build, as absolute paths
+        
+        Ninja keeps them in .ninja_deps; Makefile trees keep the compiler's
+        depfiles next to the objects.
+        """
+        raw: Dict[str, List[str]] = {}
+        make_program = self._read_cmake_cache().get("CMAKE_MAKE_PROGRAM")
+        if make_program and Path(make_program).stem.lower() == "ninja":
+            try:
+                result = subprocess.run([make_program, "-C", str(self.build_dir), "-t", "deps"],
+                                        capture_output=True, text=True, timeout=60)
+            except (OSError, subprocess.TimeoutExpired):
+                return {}
+            if result.returncode == 0:
+                raw = parse_ninja_deps(result.stdout)
+        else:
+            for suffix in OBJECT_SUFFIXES:
+                for depfile in self.build_dir.rglob(f"*{suffix}.d"):
+                    try:
+                        raw.update(parse_depfile(depfile.read_text(encoding="utf-8", errors="replace")))
+                    except OSError:
+                        continue
+        base = str(self.build_dir)
+        return {os.path.normpath(os.path.join(base, target)): [os.path.normpath(os.path.join(base, dep))
+                                                              for dep in deps]
+                for target, deps in raw.items()}
+    
+    def _report_codegen(self, kind: str):
+        """Report and accumulate the write-if-changed counters of a generator run
+        
+        Compiles spared are the objects whose recorded dependencies include
+        a file that was left untouched; each would otherwise have recompiled.
+        """
+        counts = dict(self._codegen_counts)
+        untouched = {os.path.normpath(str(path.absolute())) for path in self._codegen_untouched}
+        self._codegen_counts = {"written": 0, "unchanged": 0}
+        self._codegen_untouched = []
+        if not counts["written"] and not counts["unchanged"]:
+            return
+        counts["compiles_spared"] = sum(1 for deps in self._compiled_dependencies().values()
+                                        if not untouched.isdisjoint(deps)) if untouched else 0
+        totals = dict((self._load_state("codegen.json") or {}).get(kind, {}))
+        for name, count in counts.items():
+            totals[name] = totals.get(name, 0) + count
+        state = dict(self._load_state("codegen.json") or {})
+        state[kind] = totals
+        self._save_state("codegen.json", state)
+        print_info(f"Generated {kind} files: {counts['written']} written, {counts['unchanged']} left untouched, "
+                   f"sparing {counts['compiles_spared']} compiles ({totals['compiles_spared']} so far)")
+    
+    def _toolchain_key(self, resolved: Dict[str, Optional[str]]) -> dict:
+        """Cache key for toolchain probes: PATH plus resolved binaries and their mtimes"""
+        tools = {}
+        for tool, path in resolved.items():
+            mtime = None
+            if path:
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+            tools[tool] = [path, mtime]
+        return {"PATH": os.environ.get("PATH", ""), "tools": tools}
+    
+    def probe_toolchain(self) -> Dict[str, Optional[str]]:
+        """Return the version line of each build tool, or None if it is unavailable
+        
+        Probes run concurrently and are cached in the build directory, so no
+        process is spawned until PATH or one of the resolved binaries changes.
+        """
+        tools = ["cmake", "ccache"]
+        if self.is_linux or self.is_macos:
+            tools.insert(1, "clang++")
+        
+        resolved = {tool: shutil.which(tool) for tool in tools}
+        key = self._toolchain_key(resolved)
+        cached = self._load_state("toolchain.json")
+        if cached and cached.get("key") == key:
+            return cached["versions"]
+        
+        # Tools missing from PATH cannot succeed, so only spawn the ones we found
+        versions: Dict[str, Optional[str]] = {tool: None for tool in tools}
+        present = [tool for tool in tools if resolved[tool]]
+        if present:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=len(present)) as pool:
+                results = pool.map(lambda tool: self._check_command(resolved[tool]), present)
+                versions.update(zip(present, results))
+        
+        # Don't cache transient failures (e.g. a timed out probe)
+        if all(versions[tool] for tool in present):
+            self._save_state("toolchain.json", {"key": key, "versions": versions})
+        return versions
+    
+    def _read_cmake_cache(self, build_dir: Optional[Path] = None) -> Dict[str, str]:
+        """Read CMakeCache.txt from the build directory as a name -> value mapping"""
+        cache = {}
+        try:
+            with open((build_dir or self.build_dir) / "CMakeCache.txt", "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if not line or line[0] in "#/\n" or "=" not in line:
+                        continue
+                    name_type, value = line.rstrip("\n").split("=", 1)
+                    cache[name_type.split(":", 1)[0]] = value
+        except OSError:
+            pass
+        return cache
+    
+    def get_engine_root(self) -> Optional[Path]:
+        """Resolve ZENGINE_ROOT the same way CMakeLists.txt does"""
+        engine_root = self._read_cmake_cache().get("ZENGINE_ROOT") or os.environ.get("ZENGINE_ROOT")
+        return Path(engine_root) if engine_root else None
+    
+    def get_engine_version(self) -> Optional[str]:
+        """Engine version the project was created for, from ZEngineDemo.zproject"""
+        try:
+            with open(self.root_dir / "ZEngineDemo.zproject", "r", encoding="utf-8") as f:
+                return json.load(f).get("engine_version")
+        except (OSError, ValueError):
+            return None
+    
+    def resolve_configure_preset(self, name: str) -> dict:
+        """Configure preset with the fields of the presets it inherits merged in"""
+        presets = self.load_presets()["configure"]
+        preset = presets.get(name, {})
+        parents = preset.get("inherits", [])
+        if isinstance(parents, str):
+            parents = [parents]
+        resolved: dict = {}
+        # Earlier parents take precedence over later ones, the preset over all
+        for parent in reversed(parents):
+            if parent in presets and parent != name:
+                for field, value in self.resolve_configure_preset(parent).items():
+                    resolved[field] = {**resolved.get(field, {}), **value} if isinstance(value, dict) else value
+        for field, value in preset.items():
+            resolved[field] = {**resolved.get(field, {}), **value} if isinstance(value, dict) else value
+        return resolved
+    
+    def get_toolchain_fingerprint(self, preset: str) -> str:
+        """Identify the ABI a configure preset builds for: compiler, its version and build type"""
+        resolved = self.resolve_configure_preset(preset)
+        build_type = resolved.get("cacheVariables", {}).get("CMAKE_BUILD_TYPE", "")
+        if isinstance(build_type, dict):
+            build_type = build_type.get("value", "")
+        compiler = resolved.get("environment", {}).get("CXX") or os.environ.get("CXX") \
+            or ("cl" if self.is_windows else "c++")
+        version = self.get_compiler_version(compiler)
+        
+        identity = [self.system, platform.machine(), version, resolved.get("toolset"), build_type]
+        return hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:16]
+    
+    def get_compiler_version(self, compiler: str) -> str:
+        """Version line of a compiler, cached per binary since asking spawns a process"""
+        path = shutil.which(compiler)
+        key = json.dumps([path, os.stat(path).st_mtime_ns] if path else [compiler, None])
+        cached = self._load_state("compilers.json") or {}
+        if key not in cached:
+            cached = {**cached, key: (self._check_command(path) if path else None) or compiler}
+            self._save_state("compilers.json", cached)
+        return cached[key]
+    
+    def get_prebuilt_root(self) -> Path:
+        """Directory holding prebuilt engine installs, laid out as <engine_version>/<toolchain>/"""
+        root = os.environ.get("ZENGINE_PREBUILT_ROOT")
+        return Path(root) if root else Path.home() / ".zengine" / "prebuilt"
+    
+    def find_prebuilt_engine(self, preset: str) -> Optional[Path]:
+        """Prebuilt engine install matching the project's engine version and the preset's toolchain"""
+        version = self.get_engine_version()
+        if not version:
+            return None
+        install = self.get_prebuilt_root() / version / self.get_toolchain_fingerprint(preset)
+        if (install / "lib" / "cmake" / "ZEngine" / "ZEngineConfig.cmake").exists():
+            return install
+        return None
+    
+    def get_engine_store(self) -> ArtifactStore:
+        """Store shared by all projects on this machine for engine build outputs"""
+        root = os.environ.get("ZENGINE_STORE")
+        return ArtifactStore(Path(root) if root else Path.home() / ".zengine" / "store")
+    
+    def _engine_artifact_key(self, config: str) -> Optional[Tuple[str, dict]]:
+        """Store key of the engine outputs this build tree produces
+        
+        Covers the engine commit, build type, compiler and flags. Returns None
+        when the engine is prebuilt or has uncommitted changes, since then the
+        commit does not describe the outputs.
+        """
+        cache = self._read_cmake_cache()
+        engine_root = self.get_engine_root()
+        if not cache or not engine_root or cache.get("ZENGINE_PREBUILT_DIR"):
+            return None
+        revision = read_git_revision(engine_root)
+        if not revision:
+            return None
+        try:
+            status = subprocess.run(["git", "-C", str(engine_root), "status", "--porcelain",
+                                     "--untracked-files=no"], capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if status.returncode != 0 or status.stdout.strip():
+            return None
+        
+        build_type = cache.get("CMAKE_BUILD_TYPE") or config
+        compiler = cache.get("CMAKE_CXX_COMPILER", "")
+        flag_names = ENGINE_FLAG_VARIABLES + [f"{name}_{build_type.upper()}" for name in ENGINE_FLAG_VARIABLES]
+        info = {
+            "revision": revision,
+            "build_type": build_type,
+            "compiler": compiler,
+            "compiler_version": self.get_compiler_version(compiler) if compiler else None,
+            "flags": {name: cache.get(name, "") for name in flag_names},
+            "platform": [self.system, platform.machine()],
+        }
+        key = hashlib.sha256(json.dumps(info, sort_keys=True).encode()).hexdigest()[:32]
+        return key, info
+    
+    def _engine_output_dir(self) -> Optional[Path]:
+        output_dir = self._read_cmake_cache().get("ZENGINE_UNIFIED_OUTPUT_DIR")
+        return Path(output_dir) if output_dir else None
+    
+    def _warn_shared_engine_outputs(self, trees: List[Path]):
+        """Warn when configured trees of different build types write the same engine outputs"""
+        owners: Dict[str, set] = {}
+        for tree in trees:
+            cache = self._read_cmake_cache(tree)
+            if cache.get("ZENGINE_UNIFIED_OUTPUT_DIR") and not cache.get("ZENGINE_PREBUILT_DIR"):
+                owners.setdefault(cache["ZENGINE_UNIFIED_OUTPUT_DIR"], set()).add(cache.get("CMAKE_BUILD_TYPE", ""))
+        for output_dir, build_types in owners.items():
+            if len(build_types) > 1:
+                print_warning(f"{', '.join(sorted(build_types))} builds share the engine output directory "
+                              f"{output_dir} and will rebuild it in turn; reconfigure them without "
+                              "ZENGINE_UNIFIED_OUTPUT_DIR to get one directory per build type")
+    
+    def _engine_lock(self) -> Optional[EngineLock]:
+        """Lock on the engine outputs shared with other projects, taken shared"""
+        output_dir = self._engine_output_dir()
+        if not output_dir or self._read_cmake_cache().get("ZENGINE_PREBUILT_DIR"):
+            return None
+        lock = EngineLock(output_dir / ".zbuild-engine.lock")
+        lock.acquire(exclusive=False)
+        return lock
+    
+    def get_engine_tree_root(self) -> Path:
+        """Directory holding the engine build trees that workspace builds share"""
+        root = os.environ.get("ZENGINE_WORKSPACE_ROOT")
+        return Path(root) if root else Path.home() / ".zengine" / "workspace"
+    
+    def _engine_tree_settings(self) -> Dict[str, str]:
+        """Cache entries a shared engine tree takes over from this tree"""
+        cache = self._read_cmake_cache()
+        build_type = cache.get("CMAKE_BUILD_TYPE", "")
+        names = ["CMAKE_BUILD_TYPE", "CMAKE_C_COMPILER", "CMAKE_CXX_COMPILER", "ZENGINE_ROOT",
+                 "ZENGINE_UNIFIED_OUTPUT_DIR"]
+        names += ENGINE_FLAG_VARIABLES + [f"{name}_{build_type.upper()}" for name in ENGINE_FLAG_VARIABLES]
+        return {name: cache[name] for name in names if cache.get(name)}
+    
+    def _engine_tree(self) -> Optional[Path]:
+        """Engine build tree shared by every project with this tree's toolchain and settings
+        
+        Trees differing only in generator share it too, since they write the
+        same engine outputs; it keeps the generator it was first configured with.
+        """
+        cache = self._read_cmake_cache()
+        settings = self._engine_tree_settings()
+        if not cache.get("CMAKE_GENERATOR") or "ZENGINE_UNIFIED_OUTPUT_DIR" not in settings:
+            return None
+        identity = json.dumps(settings, sort_keys=True)
+        return self.get_engine_tree_root() / hashlib.sha256(identity.encode()).hexdigest()[:16]
+    
+    def _configure_engine_tree(self, tree: Path) -> bool:
+        """Configure the shared engine tree from this project unless it already is
+        
+        Only the engine targets are built there, so any project can host it.
+        """
+        home = self._read_cmake_cache(tree).get("CMAKE_HOME_DIRECTORY")
+        if home and (Path(home) / "CMakeLists.txt").exists() and (tree / "ZEngineTargets.cmake").exists():
+            return True
+        if home:
+            # The project that configured the tree is gone; CMake only
+            # accepts another source directory on a fresh cache
+            (tree / "CMakeCache.txt").unlink()
+        cache = self._read_cmake_cache()
+        cmd = ["cmake", "-S", str(self.root_dir), "-B", str(tree), "-G", cache["CMAKE_GENERATOR"], "-DZ_EXPORT_ENGINE=ON"]
+        if cache.get("CMAKE_MAKE_PROGRAM"):
+            cmd.append(f"-DCMAKE_MAKE_PROGRAM={cache['CMAKE_MAKE_PROGRAM']}")
+        cmd.extend(f"-D{name}={value}" for name, value in self._engine_tree_settings().items())
+        print_info(f"Running: {' '.join(cmd)}")
+        with self._phase("configure"):
+            result = subprocess.run(cmd, cwd=self.root_dir)
+        if result.returncode != 0:
+            print_error(f"Configuring the shared engine tree {tree} failed")
+            return False
+        return True
+    
+    def _engine_fingerprint(self, tree: Path) -> str:
+        """Fingerprint of the engine sources, the shared engine outputs and the engine tree's configuration"""
+        digest = hashlib.sha256()
+        self._fingerprint_files([tree / "CMakeCache.txt"], digest)
+        engine_root = self.get_engine_root()
+        if engine_root:
+            self._fingerprint_tree(engine_root, digest)
+        self._fingerprint_tree(self._engine_output_dir(), digest)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _read_engine_stamp(path: Path) -> Optional[str]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("fingerprint")
+        except (OSError, ValueError):
+            return None
+    
+    def restore_engine_outputs(self, config: str) -> Optional[str]:
+        """Copy the stored engine outputs matching this build into the shared output directory
+        
+        Another project built with different settings may have replaced
+        them; restoring keeps the native build from reusing those, and from
+        relinking engine outputs it already built. Returns the store key.
+        """
+        key = self._engine_artifact_key(config)
+        output_dir = self._engine_output_dir()
+        if not key or not output_dir:
+            return None
+        copied = self.get_engine_store().materialize(key[0], output_dir)
+        if copied:
+            print_info(f"Restored {copied} engine outputs for {key[1]['build_type']} "
+                       f"@ {key[1]['revision'][:10]} from the engine store")
+        return key[0]
+    
+    def publish_engine_outputs(self, config: str) -> bool:
+        """Record the engine outputs of a successful build in the engine store"""
+        key = self._engine_artifact_key(config)
+        output_dir = self._engine_output_dir()
+        if not key or not output_dir or not output_dir.is_dir():
+            return False
+        store = self.get_engine_store()
+        added = store.publish(key[0], output_dir, {**key[1], "project": str(self.root_dir)})
+        if added:
+            print_info(f"Stored {added} new engine outputs in {store.root}")
+        max_size = os.environ.get("ZENGINE_STORE_MAX_SIZE")
+        removed, freed = store.evict(int(float(max_size) * (1 << 30)) if max_size else ENGINE_STORE_MAX_SIZE)
+        if removed:
+            print_info(f"Evicted {removed} least recently used engine builds ({freed >> 20} MiB)")
+        return True
+    
+    def show_engine_store(self, max_size: Optional[int] = None) -> bool:
+        """List the engine store, evicting down to max_size bytes if given"""
+        print_header("Engine artifact store")
+        store = self.get_engine_store()
+        if max_size is not None:
+            removed, freed = store.evict(max_size)
+            print_info(f"Evicted {removed} entries, freed {freed >> 20} MiB")
+        
+        entries = sorted(store.all_entries(), key=lambda item: -item[1].get("last_used", 0))
+        if not entries:
+            print_info(f"{store.root} is empty")
+            return True
+        current = self._engine_artifact_key("debug")
+        total = 0
+        seen = set()
+        for key, entry in entries:
+            size = sum(info["size"] for info in entry["files"].values())
+            total += sum(info["size"] for info in entry["files"].values() if info["hash"] not in seen)
+            seen.update(info["hash"] for info in entry["files"].values())
+            marker = "*" if current and current[0] == key else " "
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.get("last_used", 0)))
+            print(f"  {marker} {key[:12]}  {entry['revision'][:10]}  {entry['build_type']:<14} "
+                  f"{size / (1 << 20):8.1f} MiB  {used}  {entry.get('compiler_version') or entry['compiler']}")
+        print_info(f"{len(entries)} engine builds, {total / (1 << 20):.1f} MiB in {store.root}")
+        return True
+    
+    def _fingerprint_tree(self, root: Path, digest) -> None:
+        """Feed the path, size and mtime of every file below root into digest"""
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name.startswith(".") or entry.name in FINGERPRINT_SKIP_DIRS:
+                            continue
+                        pending.append(Path(entry.path))
+                    else:
+                        st = entry.stat()
+                        digest.update(f"{entry.path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+                except OSError:
+                    continue
+    
+    def _fingerprint_files(self, paths: List[Path], digest) -> None:
+        """Feed the size and mtime of individual files into digest"""
+        for path in paths:
+            try:
+                st = path.stat()
+                digest.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+            except OSError:
+                digest.update(f"{path}\0missing\n".encode())
+    
+    def _snapshot_tree(self, root: Path, snapshot: Dict[str, Optional[List[int]]]) -> None:
+        """Record the size and mtime of every file and directory below root
+        
+        Directories are recorded too: adding, removing or renaming an entry
+        changes the directory's mtime, so stat calls alone notice new files.
+        """
+        pending = [root]
+        self._snapshot_files([root], snapshot)
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name.startswith(".") or entry.name in FINGERPRINT_SKIP_DIRS:
+                            continue
+                        pending.append(Path(entry.path))
+                    st = entry.stat(follow_symlinks=False)
+                    snapshot[entry.path] = [st.st_size, st.st_mtime_ns]
+                except OSError:
+                    continue
+    
+    def _snapshot_files(self, paths: List[Path], snapshot: Dict[str, Optional[List[int]]]) -> None:
+        """Record the size and mtime of individual files, or None for missing ones"""
+        for path in paths:
+            try:
+                st = os.stat(path)
+                snapshot[str(path)] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                snapshot[str(path)] = None
+    
+    @staticmethod
+    def _snapshot_unchanged(snapshot: Dict[str, Optional[List[int]]]) -> bool:
+        """Whether every path in a snapshot still has the recorded size and mtime"""
+        for path, recorded in snapshot.items():
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                if recorded is not None:
+                    return False
+                continue
+            if recorded != [st.st_size, st.st_mtime_ns]:
+                return False
+        return True
+    
+    def _build_key(self, config: str, target: Optional[str], preset: Optional[str]) -> List[Optional[str]]:
+        """What a build stamp is only valid for, besides its tracked files"""
+        engine_root = self.get_engine_root()
+        return [config, target, preset, str(engine_root) if engine_root else None]
+    
+    def _snapshot_build_inputs(self) -> Dict[str, Optional[List[int]]]:
+        """Snapshot every input of a build: sources, presets, CMake scripts and the engine tree"""
+        snapshot: Dict[str, Optional[List[int]]] = {}
+        self._snapshot_files([
+            self.root_dir / "CMakeLists.txt",
+            self.root_dir / "CMakePresets.json",
+            self.root_dir / "precompile.cmake",
+            self.root_dir / "precompile.json.in",
+            self.root_dir / "ZEngineDemo.zproject",
+            self.build_dir / "CMakeCache.txt",
+        ], snapshot)
+        self._snapshot_tree(self.root_dir / "source", snapshot)
+        self._snapshot_tree(self.root_dir / "presets", snapshot)
+        # A prebuilt engine is immutable and its path is part of CMakeCache.txt
+        engine_root = self.get_engine_root()
+        if engine_root and not self._read_cmake_cache().get("ZENGINE_PREBUILT_DIR"):
+            self._snapshot_tree(engine_root, snapshot)
+        return snapshot
+    
+    def _snapshot_engine_outputs(self) -> Dict[str, Optional[List[int]]]:
+        """Snapshot the engine outputs, which are shared, so another project may replace them"""
+        snapshot: Dict[str, Optional[List[int]]] = {}
+        engine_outputs = self._engine_output_dir()
+        if engine_outputs:
+            self._snapshot_tree(engine_outputs, snapshot)
+        return snapshot
+    
+    def _build_is_current(self, config: str, target: Optional[str], preset: Optional[str]) -> bool:
+        """Whether nothing tracked by the last successful build has changed since
+        
+        Only stats the files and directories the stamp recorded, without
+        listing or hashing any tree.
+        """
+        stamp = self._load_state("build_stamp.json")
+        if not stamp or stamp.get("key") != self._build_key(config, target, preset):
+            return False
+        return self._snapshot_unchanged(stamp.get("inputs", {})) and self._snapshot_unchanged(stamp.get("outputs", {}))
+    
+    def _configure_fingerprint(self, preset: str, extra_args: Optional[List[str]]) -> str:
+        """Hash everything a configure reads: CMake scripts, presets, project files and environment
+        
+        CMake scripts are hashed by content. For source trees only the file
+        names count, since a file(GLOB) result depends on them but not on
+        what the files contain.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps([preset, extra_args or [],
+                                  {name: os.environ.get(name) for name in CONFIGURE_ENV}]).encode())
+        
+        roots = [self.root_dir]
+        engine_root = self.get_engine_root()
+        if engine_root:
+            roots.append(engine_root)
+        for root in roots:
+            pending = [root]
+            while pending:
+                directory = pending.pop()
+                try:
+                    entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+                except OSError:
+                    continue
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith(".") and entry.name not in FINGERPRINT_SKIP_DIRS:
+                            pending.append(Path(entry.path))
+                        continue
+                    digest.update(f"{entry.path}\n".encode())
+                    if entry.name == "CMakeLists.txt" or entry.name.endswith((".cmake", ".in")) \
+                            or directory == root and entry.name.endswith((".json", ".zproject")) \
+                            or os.path.basename(directory) == "presets":
+                        try:
+                            with open(entry.path, "rb") as f:
+                                digest.update(hashlib.sha256(f.read()).digest())
+                        except OSError:
+                            continue
+        return digest.hexdigest()
+    
+    def _invalidate_build_stamp(self):
+        """Forget the last successful build so the next build runs the native tool"""
+        try:
+            self._state_path("build_stamp.json").unlink()
+        except OSError:
+            pass
+    
+    def get_memory(self) -> Tuple[Optional[int], Optional[int]]:
+        """Physical memory of the machine and the part available for new processes, in bytes"""
+        total = available = None
+        if self.is_linux:
+            try:
+                with open("/proc/meminfo", "r") as f:
+                    for line in f:
+                        if line.startswith("MemTotal:"):
+                            total = int(line.split()[1]) * 1024
+                        elif line.startswith("MemAvailable:"):
+                            available = int(line.split()[1]) * 1024
+            except (OSError, ValueError, IndexError):
+                pass
+            if total is not None and available is not None:
+                return total, available
+        if self.is_windows:
+            import ctypes
+            
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+            
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullTotalPhys, status.ullAvailPhys
+            return None, None
+        try:
+            page_size = os.sysconf("SC_PAGE_SIZE")
+            if total is None:
+                total = os.sysconf("SC_PHYS_PAGES") * page_size
+            if available is None:
+                available = os.sysconf("SC_AVPHYS_PAGES") * page_size
+        except (AttributeError, ValueError, OSError):
+            pass
+        return total, available
+    
+    def get_available_memory(self) -> Optional[int]:
+        """Physical memory available for new processes, in bytes"""
+        return self.get_memory()[1]
+    
+    def get_total_memory(self) -> Optional[int]:
+        """Physical memory of the machine, in bytes"""
+        return self.get_memory()[0]
+    
+    def _record_job_memory(self, peak_rss: int, jobs: Optional[int], oom: bool = False):
+        """Remember the peak RSS of the largest compile of a finished build
+        
+        After an OOM kill the sample is the memory each job turned out to need
+        (available memory / jobs), so the next automatic job count stays below it.
+        """
+        history = self._load_state("job_memory.json") or {}
+        samples = history.get("samples", [])
+        samples.append({"peak_rss": peak_rss, "jobs": jobs, "time": time.time(), "oom": oom})
+        self._save_state("job_memory.json", {"samples": samples[-JOB_MEMORY_SAMPLES:]})
+    
+    def get_job_memory(self) -> Optional[int]:
+        """Peak RSS of a single compile job seen over recent builds, if any were measured"""
+        history = self._load_state("job_memory.json") or {}
+        samples = [sample["peak_rss"] for sample in history.get("samples", [])]
+        return max(samples) if samples else None
+    
+    def auto_job_count(self, policy: str = "memory",
+                       mem_per_job: Optional[int] = None) -> Tuple[int, str]:
+        """Pick a parallel job count and describe how it was chosen
+        
+        The memory policy caps the core count by how many of the heaviest
+        jobs seen so far fit into currently available memory.
+        """
+        cpu_count = os.cpu_count() or 1
+        if policy == "cpu":
+            return cpu_count, f"{cpu_count} cores, cpu policy"
+        
+        available = self.get_available_memory()
+        if available is None:
+            return cpu_count, f"{cpu_count} cores, available memory unknown"
+        
+        if mem_per_job:
+            source = "override"
+        else:
+            mem_per_job = self.get_job_memory()
+            source = "measured peak" if mem_per_job else "default estimate"
+            mem_per_job = mem_per_job or DEFAULT_JOB_MEMORY
+        
+        memory_jobs = max(1, int(available * JOB_MEMORY_BUDGET // mem_per_job))
+        jobs = min(cpu_count, memory_jobs)
+        limit = "memory-bound" if memory_jobs < cpu_count else "core-bound"
+        return jobs, (f"{limit}: {available / (1 << 30):.1f} GiB available, "
+                      f"{mem_per_job / (1 << 30):.2f} GiB per job ({source}), {cpu_count} cores")
+    
+    def _run_build_command(self, cmd: List[str], env: Optional[Dict[str, str]] = None,
+                           on_line=None) -> Tuple[int, Optional[int]]:
+        """Run a native build command, returning its exit code and peak RSS in bytes
+        
+        The peak comes from wait4(), which reports the largest single process in
+        the child's tree - the heaviest compiler or linker invocation alike.
+        If on_line is given, output is echoed line by line and passed to
+        on_line(line, timestamp) as it arrives.
+        """
+        if on_line:
+            process = subprocess.Popen(cmd, cwd=self.root_dir, env=env, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True, errors="replace")
+            for line in process.stdout:
+                sys.stdout.write(line)
+                on_line(line, time.time())
+            process.stdout.close()
+        else:
+            process = subprocess.Popen(cmd, cwd=self.root_dir, env=env)
+        if not hasattr(os, "wait4"):
+            return process.wait(), None
+        
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        except KeyboardInterrupt:
+            process.wait()
+            raise
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+        peak_rss = usage.ru_maxrss if self.is_macos else usage.ru_maxrss * 1024
+        return process.returncode, peak_rss
+    
+    def _oom_kill_count(self, cgroup_only: bool = False) -> Optional[int]:
+        """OOM kills counted by the kernel plus our cgroup so far, or by our cgroup alone (Linux only)"""
+        if not self.is_linux:
+            return None
+        sources = [] if cgroup_only else [Path("/proc/vmstat")]
+        try:
+            with open("/proc/self/cgroup", "r") as f:
+                for line in f:
+                    if line.startswith("0::"):
+                        sources.append(Path("/sys/fs/cgroup") / line[3:].strip().lstrip("/") / "memory.events")
+        except OSError:
+            pass
+        
+        total = None
+        for source in sources:
+            try:
+                with open(source, "r") as f:
+                    for line in f:
+                        name, _, value = line.partition(" ")
+                        if name == "oom_kill":
+                            total = (total or 0) + int(value)
+            except (OSError, ValueError):
+                continue
+        return total
+    
+    def _recent_oom_victims(self, count: int) -> List[str]:
+        """Best-effort names of the last OOM-killed processes from the kernel log"""
+        try:
+            result = subprocess.run(["dmesg"], capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            return []
+        victims = re.findall(r"Killed process \d+ \(([^)]+)\)", result.stdout)
+        return victims[-count:] if count > 0 else []
+    
+    def _supports_jobserver_client(self, build_dir: Optional[Path] = None) -> bool:
+        """Whether the configured native build tool joins a FIFO jobserver"""
+        make_program = self._read_cmake_cache(build_dir).get("CMAKE_MAKE_PROGRAM")
+        version = self._check_command(make_program) if make_program else None
+        if not version:
+            return False
+        numbers = [int(part) for part in version.split()[-1].split(".")[:2] if part.isdigit()]
+        if "GNU Make" in version:
+            return numbers >= [4, 4]
+        if Path(make_program).stem.lower() == "ninja":
+            return numbers >= [1, 13]
+        return False
+    
+    def link_job_count(self) -> Tuple[int, str]:
+        """Size the Ninja link pool and describe how it was chosen
+        
+        As many of the heaviest links measured in this tree as fit into a
+        share of physical memory, capped by the core count. Total rather
+        than available memory keeps the size, and so the configure, stable.
+        """
+        cpu_count = os.cpu_count() or 1
+        total = self.get_total_memory()
+        samples = [sample["peak_rss"] for sample in (self._load_state("link_memory.json") or {}).get("samples", [])
+                   if sample.get("peak_rss")]
+        link_memory = max(samples) if samples else DEFAULT_LINK_MEMORY
+        source = "measured peak" if samples else "default estimate"
+        if total is None:
+            return max(1, cpu_count // 4), "total memory unknown"
+        jobs = max(1, min(cpu_count, int(total * LINK_MEMORY_SHARE // link_memory)))
+        return jobs, (f"{total / (1 << 30):.1f} GiB total, "
+                      f"{link_memory / (1 << 20):.0f} MiB per link ({source})")
+    
+    def _job_pool_args(self, link_jobs: Optional[int] = None) -> List[str]:
+        """Cache entries giving a Ninja tree a wide compile pool and a narrow link pool
+        
+        The link launcher measures the peak RSS of every link for the next
+        sizing and for the concurrency report after each build.
+        """
+        compile_jobs = os.cpu_count() or 1
+        if link_jobs:
+            reason = "--link-jobs"
+        else:
+            link_jobs, reason = self.link_job_count()
+        print_info(f"Job pools: compile={compile_jobs}, link={link_jobs} ({reason})")
+        pools = [f"-DZ_JOB_POOLS=compile={compile_jobs};link={link_jobs}"]
+        # CMAKE_<LANG>_LINKER_LAUNCHER needs CMake 3.21; older ones ignore it
+        match = re.search(r"(\d+)\.(\d+)", self.probe_toolchain().get("cmake") or "")
+        if match and (int(match.group(1)), int(match.group(2))) < (3, 21):
+            print_warning(f"CMake {match.group(0)} cannot run a linker launcher (3.21+), "
+                          "so link memory is not measured and the link pool is sized from the default estimate")
+            return pools
+        launcher = ";".join([Path(sys.executable).as_posix(), ZBUILD_SCRIPT.as_posix(),
+                             "link-launcher", "--record", self._state_path("link_samples.jsonl").as_posix()])
+        return pools + [f"-DCMAKE_C_LINKER_LAUNCHER={launcher}",
+                        f"-DCMAKE_CXX_LINKER_LAUNCHER={launcher}"]
+    
+    def _compile_launcher_args(self) -> List[str]:
+        """Cache entries running every compile through the compile launcher, which records its peak RSS"""
+        launcher = ";".join([Path(sys.executable).as_posix(), ZBUILD_SCRIPT.as_posix(),
+                             "compile-launcher", "--record", self._state_path("compile_samples.jsonl").as_posix()])
+        return [f"-DCMAKE_C_COMPILER_LAUNCHER={launcher}", f"-DCMAKE_CXX_COMPILER_LAUNCHER={launcher}"]
+    
+    def _compile_launcher_installed(self) -> bool:
+        return "compile-launcher" in self._read_cmake_cache().get("CMAKE_CXX_COMPILER_LAUNCHER", "")
+    
+    def _read_launcher_samples(self, name: str, consume: bool = False) -> List[dict]:
+        """Samples a launcher appended to a JSON lines file in the state directory"""
+        path = self._state_path(name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                samples = [json.loads(line) for line in f if line.strip()]
+            if consume:
+                path.unlink()
+        except (OSError, ValueError):
+            return []
+        return samples
+    
+    def _collect_compile_samples(self, since: float) -> List[dict]:
+        """Take the compile launcher's samples and return the ones since a time"""
+        return [sample for sample in self._read_launcher_samples("compile_samples.jsonl", consume=True)
+                if sample["start"] >= since]
+    
+    def _collect_link_samples(self, since: float) -> List[dict]:
+        """Fold the link launcher's samples into link_memory.json and return the ones since a time"""
+        new = self._read_launcher_samples("link_samples.jsonl", consume=True)
+        if not new:
+            return []
+        samples = (self._load_state("link_memory.json") or {}).get("samples", []) + new
+        self._save_state("link_memory.json", {"samples": samples[-LINK_MEMORY_SAMPLES:]})
+        return [sample for sample in new if sample["start"] >= since]
+    
+    def report_link_concurrency(self, since: float, wall_time: float):
+        """Report how links overlapped in a build and how the link pool size relates to wall time"""
+        links = self._collect_link_samples(since)
+        if not links:
+            return
+        pools = dict(pair.split("=", 1) for pair in self._read_cmake_cache().get("Z_JOB_POOLS", "").split(";")
+                     if "=" in pair)
+        link_jobs = int(pools["link"]) if pools.get("link", "").isdigit() else None
+        
+        # Sweep link start/end events for peak concurrency and memory
+        events = sorted([(link["start"], 1, link.get("peak_rss") or 0) for link in links] +
+                        [(link["end"], -1, -(link.get("peak_rss") or 0)) for link in links])
+        running = peak_running = 0
+        memory = peak_memory = 0
+        overlapped = 0.0
+        last = events[0][0]
+        for timestamp, delta, rss in events:
+            if running > 1:
+                overlapped += timestamp - last
+            last = timestamp
+            running += delta
+            memory += rss
+            peak_running = max(peak_running, running)
+            peak_memory = max(peak_memory, memory)
+        link_time = sum(link["end"] - link["start"] for link in links)
+        
+        history = (self._load_state("link_pool.json") or {}).get("runs", [])
+        history = history + [{"link_jobs": link_jobs, "wall_time": wall_time, "link_time": link_time,
+                              "peak_links": peak_running, "peak_link_memory": peak_memory, "time": time.time()}]
+        self._save_state("link_pool.json", {"runs": history[-PHASE_HISTORY:]})
+        
+        print_info(f"Links: {len(links)} taking {link_time:.1f}s, up to {peak_running} at once "
+                   f"(pool {link_jobs or 'unlimited'}), {overlapped:.1f}s overlapping, "
+                   f"peak link memory {peak_memory / (1 << 20):.0f} MiB")
+        by_pool: Dict[Optional[int], List[float]] = {}
+        for run in history:
+            by_pool.setdefault(run["link_jobs"], []).append(run["wall_time"])
+        if len(by_pool) > 1:
+            for pool, times in sorted(by_pool.items(), key=lambda item: item[0] or 0):
+                times = sorted(times)
+                print_info(f"    link pool {pool or 'unlimited'}: median wall time "
+                           f"{times[len(times) // 2]:.1f}s over {len(times)} build(s)")
+    
+    @contextmanager
+    def _phase(self, name: str):
+        """Record the wall-clock span of a zbuild phase for trace export"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            phases = (self._load_state("phases.json") or {}).get("phases", [])
+            phases.append({"name": name, "start": start, "end": time.time()})
+            self._save_state("phases.json", {"phases": phases[-PHASE_HISTORY:]})
+    
+    def check_requirements(self) -> bool:
+        """Check if required tools are available"""
+        with self._phase("requirements"):
+            return self._check_requirements()
+    
+    def _check_requirements(self) -> bool:
+        print_info("Checking build requirements...")
+        versions = self.probe_toolchain()
+        
+        # Check CMake
+        cmake_version = versions["cmake"]
+        if not cmake_version:
+            print_error("CMake is not installed or not in PATH")
+            return False
+        
+        print_info(f"Found CMake: {cmake_version.split()[2]}")
+        
+        # Check compiler
+        if self.is_windows:
+            # Check for Visual Studio
+            vs_where = Path(r"C:\Program Files (x86)\Microsoft Visual Studio\Installer\vswhere.exe")
+            if vs_where.exists():
+                print_info("Found Visual Studio")
+            else:
+                print_warning("Visual Studio may not be installed")
+        elif self.is_linux or self.is_macos:
+            clang = versions["clang++"]
+            if clang:
+                print_info(f"Found Clang: {clang.split()[2]}")
+            else:
+                print_warning("Clang++ not found, falling back to default compiler")
+        
+        # Check for ccache (optional)
+        ccache = versions["ccache"]
+        if ccache:
+            print_info(f"Found ccache: {ccache.split()[2]}")
+        else:
+            print_info("ccache not found (optional, but recommended for faster builds)")
+        
+        return True
+    
+    def _check_command(self, cmd: str, arg: str = "--version") -> Optional[str]:
+        """Check if a command exists and return its version"""
+        try:
+            result = subprocess.run(
+                [cmd, arg],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+            if result.returncode == 0:
+                return result.stdout.strip().split('\n')[0]
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            pass
+        return None
+    
+    def load_presets(self) -> Dict[str, Dict[str, dict]]:
+        """Parse CMakePresets.json and everything it includes
+        
+        Returns {"configure": {name: preset}, "build": {name: preset}}. The result
+        is reused until one of the preset files changes.
+        """
+        if self._presets_memo:
+            stamps, presets = self._presets_memo
+            try:
+                if all(os.stat(path).st_mtime_ns == mtime for path, mtime in stamps):
+                    return presets
+            except OSError:
+                pass
+        
+        presets: Dict[str, Dict[str, dict]] = {"configure": {}, "build": {}}
+        stamps = []
+        pending = [self.root_dir / "CMakePresets.json"]
+        seen = set()
+        while pending:
+            path = pending.pop(0).resolve()
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                stamps.append((str(path), path.stat().st_mtime_ns))
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print_warning(f"Failed to read presets from {path}: {e}")
+                continue
+            for kind in ("configure", "build"):
+                for entry in data.get(f"{kind}Presets", []):
+                    presets[kind][entry["name"]] = entry
+            pending.extend(path.parent / include for include in data.get("include", []))
+        
+        self._presets_memo = (stamps, presets)
+        return presets
+    
+    def get_binary_dir(self, preset: str) -> Path:
+        """Build tree of a configure preset, expanding the macros CMake allows in binaryDir"""
+        resolved = self.resolve_configure_preset(preset)
+        binary_dir = resolved.get("binaryDir")
+        if not binary_dir:
+            return self.build_root
+        macros = {
+            "sourceDir": self.root_dir.as_posix(),
+            "sourceParentDir": self.root_dir.parent.as_posix(),
+            "sourceDirName": self.root_dir.name,
+            "presetName": preset,
+            "generator": resolved.get("generator", ""),
+            "hostSystemName": self.system,
+            "dollar": "$",
+        }
+        binary_dir = re.sub(r"\$\{(\w+)\}", lambda m: macros.get(m.group(1), m.group(0)), binary_dir)
+        binary_dir = re.sub(r"\$env\{(\w+)\}", lambda m: os.environ.get(m.group(1), ""), binary_dir)
+        path = Path(binary_dir)
+        return path if path.is_absolute() else self.root_dir / path
+    
+    def resolve_build_dir(self, config: Optional[str], preset: Optional[str] = None,
+                          generator: Optional[str] = None, kind: str = "configure") -> Path:
+        """Build tree a command works on, from its preset or configuration
+        
+        Without a preset or generator, an already configured tree for the
+        configuration wins over the platform's default generator.
+        """
+        presets = self.load_presets()
+        if preset:
+            if kind == "build":
+                preset = presets["build"].get(preset, {}).get("configurePreset", preset)
+            return self.get_binary_dir(preset)
+        
+        candidates = [self.get_preset_name(config or "debug", generator)]
+        if not generator:
+            candidates.append(self.get_preset_name(config or "debug", "ninja"))
+        dirs = [self.get_binary_dir(name) for name in candidates if name in presets["configure"]]
+        for path in dirs:
+            if (path / "CMakeCache.txt").exists():
+                return path
+        return dirs[0] if dirs else self.build_root
+    
+    def use_build_dir(self, path: Optional[Path] = None):
+        """Switch to a build tree, or back to the one used last, and remember the choice"""
+        last = (self._load_state("build_dir.json") or {}).get("path")
+        if path is None:
+            path = Path(last) if last else self.build_root
+        self.build_dir = path
+        if str(path) != last:
+            self._save_state("build_dir.json", {"path": str(path)})
+    
+    def get_preset_name(self, config: str, generator: Optional[str] = None) -> str:
+        """Get CMake preset name based on platform and configuration"""
+        if self.is_windows:
+            if generator == "ninja":
+                preset = "windows_ninja"
+            else:
+                preset = "windows_visual_studio"
+            return preset
+        elif self.is_linux:
+            if generator == "ninja":
+                preset = "linux_ninja"
+            else:
+                preset = "linux_make"
+            return f"{preset}_{config}"
+        elif self.is_macos:
+            if generator == "ninja":
+                preset = "macos_ninja"
+            else:
+                preset = "macos_xcode"
+            return f"{preset}_{config}"
+        else:
+            raise RuntimeError(f"Unsupported platform: {self.system}")
+    
+    def configure(self, config: str = "debug", generator: Optional[str] = None, 
+                  preset: Optional[str] = None, extra_args: Optional[List[str]] = None,
+                  force: bool = False, profile: bool = False, engine: str = "auto",
+                  link_jobs: Optional[int] = None) -> bool:
+        """Configure the build system"""
+        print_header(f"Configuring ZEngineDemo ({config})")
+        
+        # Use preset if available
+        if preset:
+            if preset not in self.load_presets()["configure"]:
+                print_error(f"Unknown configure preset: {preset}")
+                return False
+            print_info(f"Using preset: {preset}")
+            cmd = ["cmake", "--preset", preset]
+        else:
+            # Fallback to manual configuration
+            preset = self.get_preset_name(config, generator)
+            print_info(f"Using preset: {preset}")
+            cmd = ["cmake", "--preset", preset]
+        
+        # Consume a matching prebuilt engine instead of configuring and
+        # building the whole engine graph; fall back to source otherwise
+        prebuilt = None
+        if engine != "source":
+            prebuilt = self.find_prebuilt_engine(preset)
+            if prebuilt:
+                print_info(f"Using prebuilt engine: {prebuilt}")
+            elif engine == "prebuilt":
+                print_error(f"No prebuilt engine {self.get_engine_version()} for toolchain "
+                            f"{self.get_toolchain_fingerprint(preset)} in {self.get_prebuilt_root()}")
+                return False
+            else:
+                print_info("No matching prebuilt engine, building the engine from source")
+        cmd.append(f"-DZENGINE_PREBUILT_DIR={prebuilt.as_posix() if prebuilt else ''}")
+        
+        # Ninja runs big shared-library links in a narrower pool than compiles
+        if "Ninja" in self.resolve_configure_preset(preset).get("generator", ""):
+            cmd.extend(self._job_pool_args(link_jobs))
+        elif link_jobs:
+            print_warning("--link-jobs only applies to Ninja presets")
+        # Compile jobs are measured on their own for the memory job policy
+        if re.search("Ninja|Makefiles", self.resolve_configure_preset(preset).get("generator", "")):
+            cmd.extend(self._compile_launcher_args())
+        
+        if extra_args:
+            cmd.extend(extra_args)
+        
+        # A build-mode switch alone never makes the configuration stale; a
+        # skipped configure still applies it to the cache
+        switches = {}
+        for arg in cmd[3:]:
+            match = re.match(r"-D(\w+)(?::\w+)?=(.*)", arg)
+            if match and match.group(1) in BUILD_MODE_OPTIONS:
+                switches[match.group(1)] = match.group(2)
+        fingerprint = self._configure_fingerprint(preset, [arg for arg in cmd[3:] if not any(
+            arg.startswith((f"-D{name}=", f"-D{name}:")) for name in switches)])
+        
+        profile_path = self._state_path("configure_trace.json")
+        if profile:
+            profile_path.parent.mkdir(parents=True, exist_ok=True)
+            cmd.extend(["--profiling-format=google-trace", f"--profiling-output={profile_path}"])
+        
+        # Skip CMake entirely when nothing it reads changed since the last
+        # successful configure and the cache it wrote is untouched
+        cache_path = self.build_dir / "CMakeCache.txt"
+        stamp = self._load_state("configure_stamp.json")
+        if not force and not profile and stamp and stamp.get("fingerprint") == fingerprint and cache_path.exists() \
+                and stamp.get("cache_mtime") == cache_path.stat().st_mtime_ns:
+            print_success("Configuration is up to date (use --force to re-run CMake)")
+            return self._ensure_cache_options(switches)
+        
+        print_info(f"Running: {' '.join(cmd)}")
+        with self._phase("configure"):
+            result = subprocess.run(cmd, cwd=self.root_dir)
+        
+        self._invalidate_build_stamp()
+        if result.returncode != 0:
+            self._save_state("configure_stamp.json", {})
+            print_error("Configuration failed")
+            return False
+        
+        self._save_state("configure_stamp.json", {
+            "fingerprint": fingerprint,
+            "cache_mtime": cache_path.stat().st_mtime_ns,
+        })
+        if profile:
+            self.report_configure_profile(profile_path)
+        print_success("Configuration completed successfully")
+        return True
+    
+    def report_configure_profile(self, path: Path, top: int = 15) -> bool:
+        """Print the most expensive CMake commands and files of a profiled configure"""
+        report = summarize_cmake_profile(path)
+        if not report:
+            print_error(f"Cannot read CMake profile {path}")
+            return False
+        self._save_state("configure_profile.json", report)
+        
+        print_info(f"Configure took {report['total']:.2f}s")
+        print_info("Most expensive commands (self / inclusive):")
+        for row in report["commands"][:top]:
+            print(f"    {row['self']:8.2f}s {row['inclusive']:8.2f}s  {row['count']:6d}x  {row['name']}")
+        print_info("Most expensive files (self / inclusive):")
+        for row in report["files"][:top]:
+            print(f"    {row['self']:8.2f}s {row['inclusive']:8.2f}s  {row['count']:6d} calls  {row['name']}")
+        print_info("Slowest single calls (self):")
+        for row in report["calls"][:top]:
+            print(f"    {row['self']:8.2f}s  {row['name']} {row['args'][:60]}  ({row['location']})")
+        print_success(f"Trace (open in Perfetto): {path}")
+        print_success(f"Full report: {self._state_path('configure_profile.json')}")
+        return True
+    
+    def _ensure_cache_options(self, options: Dict[str, str]) -> bool:
+        """Re-run CMake on the existing build tree if any of the given cache options differ"""
+        cache = self._read_cmake_cache()
+        if not cache:
+            return True
+        changed = {name: value for name, value in options.items()
+                   if cache.get(name, "OFF").upper() != value.upper()}
+        if not changed:
+            return True
+        return self._reconfigure(changed)
+    
+    def _reconfigure(self, defines: Optional[Dict[str, str]] = None) -> bool:
+        """Re-run CMake on the existing build tree, optionally changing cache entries"""
+        cmd = ["cmake", "-S", str(self.root_dir), "-B", str(self.build_dir)]
+        cmd.extend(f"-D{name}={value}" for name, value in (defines or {}).items())
+        print_info(f"Running: {' '.join(cmd)}")
+        with self._phase("configure"):
+            result = subprocess.run(cmd, cwd=self.root_dir)
+        self._invalidate_build_stamp()
+        if result.returncode != 0:
+            print_error("Reconfiguration failed")
+            return False
+        # Nothing a configure fingerprints changed, so its stamp still holds
+        stamp = self._load_state("configure_stamp.json")
+        if stamp and stamp.get("fingerprint"):
+            stamp["cache_mtime"] = (self.build_dir / "CMakeCache.txt").stat().st_mtime_ns
+            self._save_state("configure_stamp.json", stamp)
+        return True
+    
+    def build(self, config: str = "debug", target: Optional[str] = None,
+              jobs: Optional[int] = None, preset: Optional[str] = None,
+              force: bool = False, job_policy: str = "memory",
+              mem_per_job: Optional[int] = None, jobserver: bool = False,
+              trace: Optional[str] = None, time_trace: bool = False,
+              unity: bool = False, workspace: bool = False) -> bool:
+        """Build the project"""
+        presets = self.load_presets()
+        if preset and preset not in presets["build"]:
+            if preset not in presets["configure"]:
+                print_error(f"Unknown build preset: {preset}")
+                return False
+            # A configure preset names its tree and configuration
+            build_type = self.resolve_configure_preset(preset).get("cacheVariables", {}).get("CMAKE_BUILD_TYPE")
+            config = (build_type or config).lower()
+        print_header(f"Building ZEngineDemo ({config})")
+        
+        # Batches are written first so a reconfigure that enables them sees them
+        if unity:
+            self.generate_unity_batches()
+        build_modes = {"Z_TIME_TRACE": "ON" if time_trace else "OFF", "Z_UNITY_BUILD": "ON" if unity else "OFF"}
+        
+        # A fresh tree is configured here, build-mode switches included. CMake
+        # registers the generated reflection directory before ZParser has
+        # written it, so this single configure is all the build needs
+        if not (self.build_dir / "CMakeCache.txt").exists():
+            configure_preset = presets["build"].get(preset, {}).get("configurePreset", preset) if preset else None
+            if not self.configure(config, preset=configure_preset, extra_args=[
+                f"-D{name}={value}" for name, value in build_modes.items()
+            ]):
+                return False
+        
+        # Build-mode switches live in the CMake cache; flip them only when needed
+        if not self._ensure_cache_options(build_modes):
+            return False
+        
+        # No-op fast path: skip the native build tool entirely when no input
+        # changed since the last successful build
+        if not force and self._build_is_current(config, target, preset):
+            print_success("Build is up to date")
+            if trace:
+                self.write_trace(Path(trace))
+            return True
+        # Snapshot the inputs before the build, so edits made while the build
+        # is running still trigger the next build
+        inputs = self._snapshot_build_inputs()
+        
+        # Determine build directory
+        build_dir = self.build_dir
+        
+        # Build command; a configure preset builds its tree
+        if preset and preset in presets["build"]:
+            cmd = ["cmake", "--build", "--preset", preset]
+        else:
+            cmd = ["cmake", "--build", str(build_dir)]
+            
+            # Configuration
+            if self.is_windows:
+                config_map = {
+                    "debug": "Debug",
+                    "release": "Release",
+                    "relwithdebinfo": "RelWithDebInfo"
+                }
+                cmd.extend(["--config", config_map.get(config.lower(), "Debug")])
+            else:
+                # For Unix-like systems, use CMAKE_BUILD_TYPE
+                pass
+        
+        # Target
+        if target:
+            cmd.extend(["--target", target])
+        
+        # Jobs - Enable parallel builds for all platforms
+        max_jobs = jobs or os.cpu_count() or 1
+        if not jobs:
+            jobs, reason = self.auto_job_count(job_policy, mem_per_job)
+            print_info(f"Using {jobs} parallel jobs ({reason})")
+        
+        # Make does not log timings, so reconstruct them from its output
+        # (also needed to measure a freshly generated PCH and to size unity batches)
+        make_timer = None
+        pch_pending = any(entry.get("after") is None
+                          for entry in (self._load_state("pch.json") or {}).values())
+        record_timings = trace or unity or pch_pending
+        if record_timings and "Makefiles" in self._read_cmake_cache().get("CMAKE_GENERATOR", ""):
+            make_timer = MakeOutputTimer(self.build_dir)
+        
+        attempts: List[dict] = []
+        # A tree once built in workspace mode keeps using the shared engine tree
+        workspace = workspace or bool(self._read_cmake_cache().get("Z_ENGINE_TREE"))
+        engine_lock = self._engine_lock() if workspace else None
+        engine_tree = self._engine_tree() if engine_lock else None
+        try:
+            # Workspace mode: the engine is built once, in a tree shared by all
+            # projects with these settings, and this tree uses the targets it
+            # exports. Only a stale engine is rebuilt, holding it exclusively;
+            # project builds share it
+            stamp_path = engine_tree / "zbuild_engine_stamp.json" if engine_tree else None
+            if engine_tree and self._engine_fingerprint(engine_tree) != self._read_engine_stamp(stamp_path):
+                engine_lock.acquire(exclusive=True)
+                # Another project may have built it while this one waited
+                if self._engine_fingerprint(engine_tree) != self._read_engine_stamp(stamp_path):
+                    self.restore_engine_outputs(config)
+                    if not self._configure_engine_tree(engine_tree):
+                        return False
+                    engine_cmd = ["cmake", "--build", str(engine_tree), "--target", *ENGINE_TARGETS]
+                    attempts.extend(self._run_build_attempts(engine_cmd, jobs, max_jobs, jobserver, phase="engine"))
+                    if attempts[-1]["returncode"] == 0:
+                        self.publish_engine_outputs(config)
+                        with open(stamp_path, "w", encoding="utf-8") as f:
+                            json.dump({"fingerprint": self._engine_fingerprint(engine_tree)}, f)
+                engine_lock.acquire(exclusive=False)
+            elif not engine_lock:
+                # Engine outputs are shared with other projects; put back the ones
+                # built with this tree's settings before the native tool looks at them
+                self.restore_engine_outputs(config)
+            
+            if engine_tree and (not attempts or attempts[-1]["returncode"] == 0):
+                if not self._ensure_cache_options({"Z_ENGINE_TREE": engine_tree.as_posix()}):
+                    return False
+            if not attempts or attempts[-1]["returncode"] == 0:
+                attempts.extend(self._run_build_attempts(cmd, jobs, max_jobs, jobserver,
+                                                         make_timer.on_line if make_timer else None))
+        finally:
+            if engine_lock:
+                engine_lock.release()
+        
+        if make_timer:
+            self._save_state("make_timings.json", {"edges": make_timer.edges()})
+        
+        returncode = attempts[-1]["returncode"]
+        self._save_state("build_report.json", {
+            "config": config,
+            "preset": preset,
+            "target": target,
+            "success": returncode == 0,
+            "attempts": attempts,
+        })
+        
+        if returncode != 0:
+            print_error("Build failed")
+            return False
+        
+        retries = sum(1 for attempt in attempts if attempt["oom"])
+        if retries:
+            print_warning(f"Build needed {retries + 1} attempts; see {self._state_path('build_report.json')}")
+        
+        self.report_link_concurrency(attempts[0]["started"], sum(attempt["duration"] for attempt in attempts))
+        
+        if trace:
+            self.write_trace(Path(trace))
+        
+        if time_trace:
+            self.aggregate_time_traces()
+        
+        self._report_pch_timings()
+        self._record_source_times()
+        if not workspace:
+            self.publish_engine_outputs(config)
+        
+        # Engine outputs are snapshotted only now, since the build rewrites them
+        self._save_state("build_stamp.json", {
+            "key": self._build_key(config, target, preset),
+            "inputs": inputs,
+            "outputs": self._snapshot_engine_outputs(),
+        })
+        print_success("Build completed successfully")
+        return True
+    
+    def build_configs(self, configs: List[str], jobs: Optional[int] = None, job_policy: str = "memory",
+                      mem_per_job: Optional[int] = None, extra_args: Optional[List[str]] = None) -> bool:
+        """Build several configurations at once, each in its own tree, under one job budget
+        
+        Every configuration is built by a child zbuild. Where the build tools
+        can join a FIFO jobserver, all children draw from one token pool;
+        otherwise the budget is split evenly between them. The children build
+        in workspace mode; each build type has its own engine output directory,
+        so they do not invalidate each other's engine.
+        """
+        print_header(f"Building ZEngineDemo ({', '.join(configs)})")
+        
+        trees = {config: self.resolve_build_dir(config, kind="build") for config in configs}
+        for config, tree in trees.items():
+            print_info(f"{config}: {tree}")
+        # Multi-config generators keep every configuration in one tree
+        parallel = len(set(trees.values())) == len(configs)
+        if not parallel:
+            print_info("Configurations share a build tree, building them one after another")
+        self._warn_shared_engine_outputs(list(trees.values()))
+        
+        if not jobs:
+            jobs, reason = self.auto_job_count(job_policy, mem_per_job)
+            print_info(f"Using {jobs} parallel jobs in total ({reason})")
+        
+        env = dict(os.environ, ZBUILD_NO_DAEMON="1")
+        server = None
+        if not parallel:
+            child_args = ["--jobs", str(jobs)]
+        elif not self.is_windows and hasattr(os, "mkfifo") \
+                and all(self._supports_jobserver_client(tree) for tree in trees.values()):
+            # Every child's build tool owns one implicit token on top of the pool
+            server = Jobserver(max(1, jobs - len(configs) + 1), jobs)
+            env["MAKEFLAGS"] = server.makeflags(env.get("MAKEFLAGS", ""))
+            child_args = ["--jobserver", "--workspace"]
+            print_info(f"Sharing jobserver {server.path} between {len(configs)} builds")
+        else:
+            share = max(1, jobs // len(configs))
+            child_args = ["--jobs", str(share), "--workspace"]
+            print_info(f"No shared jobserver available, giving each build {share} jobs")
+        
+        output_lock = threading.Lock()
+        start = time.time()
+        builds = []
+        try:
+            for config in configs:
+                cmd = self._child_command(["build", "--config", config, *child_args, *(extra_args or [])])
+                builds.append(ChildBuild(config, cmd, self.root_dir, env, output_lock))
+                if not parallel:
+                    builds[-1].wait()
+            for child in builds:
+                child.wait()
+        finally:
+            if server:
+                server.close()
+        
+        for child in builds:
+            if child.returncode == 0:
+                print_success(f"{child.label}: built in {child.duration:.1f}s")
+            else:
+                print_error(f"{child.label}: build failed after {child.duration:.1f}s")
+        print_info(f"Wall time {time.time() - start:.1f}s for {sum(c.duration for c in builds):.1f}s of builds")
+        return all(child.returncode == 0 for child in builds)
+    
+    def _child_command(self, args: List[str]) -> List[str]:
+        """Command line running this script with the given arguments"""
+        return [sys.executable, str(ZBUILD_SCRIPT), *args]
+    
+    def build_matrix(self, presets: List[str], jobs: Optional[int] = None, job_policy: str = "memory",
+                     mem_per_job: Optional[int] = None, extra_args: Optional[List[str]] = None) -> bool:
+        """Build several configure presets together under one job budget
+        
+        Builds start in the given order. The next one starts once every
+        running build has reached its link phase, so its compiles fill the
+        cores the linkers leave idle; the shared jobserver keeps them all
+        within the budget. Without one, a build keeps the jobs it was started
+        with until it finishes, however few of them its link step uses, so a
+        build only starts beside others when they leave part of the budget free.
+        """
+        print_header(f"Building matrix ({', '.join(presets)})")
+        
+        known = self.load_presets()["configure"]
+        unknown = [preset for preset in presets if preset not in known]
+        if unknown:
+            print_error(f"Unknown configure preset(s): {', '.join(unknown)}")
+            return False
+        trees = {preset: self.get_binary_dir(preset) for preset in presets}
+        if len(set(trees.values())) < len(presets):
+            print_error("Matrix presets must configure distinct build trees")
+            return False
+        
+        # Configure one preset at a time; up-to-date trees are skipped
+        last_tree = self.build_dir
+        try:
+            for preset in presets:
+                self.build_dir = trees[preset]
+                config = self.resolve_configure_preset(preset).get("cacheVariables", {}).get("CMAKE_BUILD_TYPE")
+                if not self.configure(config=(config or "debug").lower(), preset=preset):
+                    return False
+        finally:
+            self.build_dir = last_tree
+        self._warn_shared_engine_outputs(list(trees.values()))
+        
+        if not jobs:
+            jobs, reason = self.auto_job_count(job_policy, mem_per_job)
+            print_info(f"Using {jobs} parallel jobs in total ({reason})")
+        
+        env = dict(os.environ, ZBUILD_NO_DAEMON="1")
+        server = None
+        if not self.is_windows and hasattr(os, "mkfifo") \
+                and all(self._supports_jobserver_client(tree) for tree in trees.values()):
+            # A build only starts beside others once they are linking, so the
+            # implicit token each build tool owns mostly goes to a linker
+            server = Jobserver(jobs, jobs)
+            env["MAKEFLAGS"] = server.makeflags(env.get("MAKEFLAGS", ""))
+            print_info(f"Sharing jobserver {server.path} between {len(presets)} builds")
+        else:
+            print_info("No shared jobserver available, so builds cannot overlap within the budget; "
+                       "building them one after another")
+        
+        output_lock = threading.Lock()
+        queue = list(presets)
+        running: List[ChildBuild] = []
+        finished: List[ChildBuild] = []
+        allotted: Dict[str, int] = {}
+        start = time.time()
+        try:
+            while queue or running:
+                for child in [child for child in running if child.done]:
+                    running.remove(child)
+                    finished.append(child)
+                
+                free = jobs - sum(allotted[child.label] for child in running)
+                if queue and all(child.linking for child in running) and (server or free > 0 or not running):
+                    preset = queue.pop(0)
+                    if server:
+                        child_args = ["--jobserver"]
+                        allotted[preset] = 0
+                    else:
+                        allotted[preset] = max(1, free)
+                        child_args = ["--jobs", str(allotted[preset])]
+                    if running:
+                        print_info(f"Starting {preset} while {', '.join(c.label for c in running)} link")
+                    cmd = self._child_command(["build", "--preset", preset, "--workspace",
+                                               *child_args, *(extra_args or [])])
+                    running.append(ChildBuild(preset, cmd, self.root_dir, env, output_lock))
+                else:
+                    time.sleep(0.2)
+        finally:
+            for child in running:
+                child.wait()
+            if server:
+                server.close()
+        wall_time = time.time() - start
+        
+        # Builds that never overlapped another one give the sequential baseline
+        history = (self._load_state("matrix.json") or {}).get("solo", {})
+        history = dict(history)
+        for child in finished:
+            overlapped = any(other is not child and other.start < child.end and child.start < other.end
+                             for other in finished)
+            if child.returncode == 0 and not overlapped:
+                history[child.label] = child.duration
+        self._save_state("matrix.json", {"solo": history})
+        
+        for child in finished:
+            phases = f"compile {child.link_start - child.start:.1f}s, link {child.end - child.link_start:.1f}s" \
+                if child.link_start else "no link step"
+            if child.returncode == 0:
+                print_success(f"{child.label}: built in {child.duration:.1f}s ({phases})")
+            else:
+                print_error(f"{child.label}: build failed after {child.duration:.1f}s")
+        
+        sequential = sum(history.get(child.label, child.duration) for child in finished)
+        estimated = [child.label for child in finished if child.label not in history]
+        print_info(f"Wall time {wall_time:.1f}s, sequential {sequential:.1f}s "
+                   f"({sequential / wall_time if wall_time else 1:.2f}x)")
+        if estimated:
+            print_info(f"No solo build on record for {', '.join(estimated)}; "
+                       "their sequential times are measured under contention")
+        return all(child.returncode == 0 for child in finished)
+    
+    def _run_build_attempts(self, cmd: List[str], jobs: int, max_jobs: int, jobserver: bool,
+                            on_line=None, phase: str = "build") -> List[dict]:
+        """Run the native build, resuming with fewer jobs after OOM kills
+        
+        Ninja and make pick up where the previous attempt stopped.
+        """
+        attempts: List[dict] = []
+        while True:
+            with self._phase(phase):
+                attempt = self._run_build_attempt(cmd, jobs, max_jobs, jobserver, on_line)
+            if phase != "build":
+                attempt["phase"] = phase
+            attempts.append(attempt)
+            if attempt["returncode"] == 0 or not attempt["oom"]:
+                break
+            if jobs <= 1 or len(attempts) > MAX_OOM_RETRIES:
+                print_error("Build was killed by the OOM killer and cannot be retried with fewer jobs")
+                break
+            
+            victims = ", ".join(attempt["victims"]) or "unknown process"
+            retry_jobs = max(1, jobs // 2)
+            attempt["retry_reason"] = (f"OOM kill ({victims}) at {jobs} jobs, "
+                                       f"retrying with {retry_jobs} jobs")
+            print_warning(f"Build job killed by the OOM killer ({victims}); "
+                          f"resuming with {retry_jobs} parallel jobs")
+            # Teach the memory policy that this many jobs did not fit
+            if attempt["available_memory"]:
+                self._record_job_memory(attempt["available_memory"] // jobs, jobs, oom=True)
+            jobs = max_jobs = retry_jobs
+        
+        return attempts
+    
+    def _run_build_attempt(self, cmd: List[str], jobs: int, max_jobs: int, jobserver: bool,
+                           on_line=None) -> dict:
+        """Run the native build once and describe how it went"""
+        cmd = list(cmd)
+        
+        # Jobserver - share one adaptive token pool with every nested tool
+        env = None
+        server = None
+        if jobserver:
+            if "--jobserver-auth=" in os.environ.get("MAKEFLAGS", ""):
+                print_info("Joining the jobserver of the calling process")
+                env = dict(os.environ)
+            elif self.is_windows or not hasattr(os, "mkfifo"):
+                print_warning("FIFO jobserver is not available on this platform, using -j")
+            elif not self._supports_jobserver_client():
+                print_warning("Build tool cannot join a FIFO jobserver (needs make 4.4+ or ninja 1.13+), using -j")
+            else:
+                server = Jobserver(jobs, max(jobs, max_jobs))
+                env = dict(os.environ, MAKEFLAGS=server.makeflags(os.environ.get("MAKEFLAGS", "")))
+                print_info(f"Hosting jobserver {server.path} ({jobs} jobs, adaptive up to {server.max_jobs})")
+        if env is None:
+            cmd.extend(["-j", str(jobs)])
+        
+        available_memory = self.get_available_memory()
+        launched = self._compile_launcher_installed()
+        oom_before = self._oom_kill_count(cgroup_only=not launched)
+        start = time.time()
+        print_info(f"Running: {' '.join(cmd)}")
+        try:
+            returncode, peak_rss = self._run_build_command(cmd, env, on_line)
+        finally:
+            if server:
+                server.close()
+                if server.adjustments:
+                    print_info(f"Jobserver adjusted parallelism {len(server.adjustments)} times, "
+                               f"finishing at {server.target} jobs")
+        duration = time.time() - start
+        
+        # The tree's peak includes links; trees that run compiles through the
+        # compile launcher record only what compiles needed
+        compiles = self._collect_compile_samples(start)
+        peaks = [sample["peak_rss"] for sample in compiles if sample.get("peak_rss")]
+        compile_rss = max(peaks) if peaks else (None if launched else peak_rss)
+        if compile_rss:
+            print_info(f"Peak memory of a single compile job: {compile_rss / (1 << 20):.0f} MiB")
+            self._record_job_memory(compile_rss, jobs)
+        
+        # A compiler killed mid-build shows up as a new kernel/cgroup OOM kill;
+        # a SIGKILLed build tool as exit status -9/137. The kernel counts kills
+        # anywhere on the machine, so with the launchers only a compile or link
+        # of this build that died of SIGKILL is taken as the victim; without
+        # them only kills in zbuild's own cgroup count
+        oom_kills = 0
+        victims: List[str] = []
+        if returncode != 0:
+            oom_after = self._oom_kill_count(cgroup_only=not launched)
+            if oom_before is not None and oom_after is not None and oom_after > oom_before:
+                if launched:
+                    killed = [sample for sample in compiles + self._read_launcher_samples("link_samples.jsonl")
+                              if sample["start"] >= start and sample.get("returncode") in (-9, 137)]
+                    oom_kills = len(killed)
+                    victims = [sample.get("tool") or sample.get("output") or "unknown" for sample in killed]
+                else:
+                    oom_kills = oom_after - oom_before
+                    victims = self._recent_oom_victims(oom_kills)
+        oom = returncode != 0 and (oom_kills > 0 or returncode in (-9, 137))
+        
+        return {
+            "jobs": jobs,
+            "jobserver": server is not None,
+            "jobserver_adjustments": server.adjustments if server else [],
+            "returncode": returncode,
+            "started": start,
+            "duration": duration,
+            "peak_rss": peak_rss,
+            "compile_peak_rss": compile_rss,
+            "available_memory": available_memory,
+            "oom": oom,
+            "oom_kills": oom_kills,
+            "victims": victims,
+        }
+    
+    def aggregate_time_traces(self, top: int = 20) -> bool:
+        """Merge every clang -ftime-trace file in the build tree into one report
+        
+        Files are streamed through a process pool; each worker condenses one
+        trace so the parent only ever holds the merged totals.
+        """
+        print_header("Aggregating clang time traces")
+        source_suffixes = (".c", ".cc", ".cpp", ".cxx", ".c++", ".m", ".mm")
+        paths = []
+        for directory, _, files in os.walk(self.build_dir):
+            for name in files:
+                if name.endswith(".json") and name[:-5].endswith(source_suffixes):
+                    paths.append(os.path.join(directory, name))
+        if not paths:
+            print_warning("No time-trace files found; is the compiler Clang?")
+            return False
+        
+        headers: Dict[str, List[float]] = {}
+        templates: Dict[str, List[float]] = {}
+        units = []
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            for summary in pool.map(summarize_time_trace, paths, chunksize=16):
+                if not summary:
+                    continue
+                units.append({
+                    "unit": os.path.relpath(summary["path"], self.build_dir)[:-5],
+                    "total": summary["total"],
+                    "frontend": summary["frontend"],
+                    "backend": summary["backend"],
+                })
+                for bucket, merged in ((summary["headers"], headers), (summary["templates"], templates)):
+                    for name, (duration, count) in bucket.items():
+                        entry = merged.setdefault(name, [0.0, 0, 0])
+                        entry[0] += duration
+                        entry[1] += count
+                        entry[2] += 1
+        
+        def ranked(merged: Dict[str, List[float]]) -> List[dict]:
+            rows = [{"name": name, "seconds": entry[0], "count": entry[1], "units": entry[2]}
+                    for name, entry in merged.items()]
+            return sorted(rows, key=lambda row: -row["seconds"])
+        
+        report = {
+            "units": sorted(units, key=lambda unit: -unit["total"]),
+            "headers": ranked(headers),
+            "templates": ranked(templates),
+        }
+        self._save_state("time_trace_report.json", report)
+        
+        print_info(f"Aggregated {len(units)} translation units")
+        print_info("Most expensive headers to parse (inclusive, summed over all TUs):")
+        for row in report["headers"][:top]:
+            print(f"    {row['seconds']:9.2f}s  {row['units']:5d} TUs  {row['name']}")
+        print_info("Most expensive template instantiations:")
+        for row in report["templates"][:top]:
+            print(f"    {row['seconds']:9.2f}s  {row['count']:6d}x  {row['name']}")
+        print_info("Slowest translation units:")
+        for unit in report["units"][:top]:
+            print(f"    {unit['total']:9.2f}s  (frontend {unit['frontend']:.2f}s, "
+                  f"backend {unit['backend']:.2f}s)  {unit['unit']}")
+        print_success(f"Full report: {self._state_path('time_trace_report.json')}")
+        return True
+    
+    def analyze_includes(self, top: int = 25, filter_text: Optional[str] = None,
+                         jobs: Optional[int] = None) -> bool:
+        """Rank headers by preprocessed bytes times the number of TUs including them
+        
+        Every entry of compile_commands.json is re-run as a preprocessor pass
+        in a process pool. The ranking is saved for PCH selection.
+        """
+        print_header("Analyzing header inclusion cost")
+        compile_commands = self.build_dir / "compile_commands.json"
+        try:
+            with open(compile_commands, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            print_error(f"Cannot read {compile_commands}; configure a preset with CMAKE_EXPORT_COMPILE_COMMANDS=ON")
+            return False
+        if filter_text:
+            entries = [entry for entry in entries if filter_text in entry.get("file", "")]
+        if not entries:
+            print_error("No translation units to analyze")
+            return False
+        
+        print_info(f"Preprocessing {len(entries)} translation units...")
+        headers: Dict[str, dict] = {}
+        units: Dict[str, List[str]] = {}
+        total_bytes = 0
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            for result in pool.map(preprocess_translation_unit, entries):
+                if not result:
+                    continue
+                total_bytes += result["bytes"]
+                units[result["file"]] = list(result["headers"])
+                for position, path in enumerate(result["order"]):
+                    info = headers.setdefault(path, {"path": path, "units": 0, "score": 0,
+                                                     "position": 0.0, "parents": {},
+                                                     "system": path in result["system"]})
+                    info["units"] += 1
+                    info["score"] += result["headers"].get(path, 0)
+                    info["position"] += position
+                    parent = result["parents"][path]
+                    info["parents"][parent] = info["parents"].get(parent, 0) + 1
+        if not units:
+            print_error("Preprocessing failed for every translation unit")
+            return False
+        
+        ranking = sorted(headers.values(), key=lambda info: -info["score"])
+        for info in ranking:
+            info["bytes"] = info["score"] // info["units"]
+            info["position"] /= info["units"]
+            info["parent"] = max(info.pop("parents").items(), key=lambda item: item[1])[0]
+        self._save_state("include_ranking.json", {
+            "units": units,
+            "headers": ranking,
+            "total_bytes": total_bytes,
+        })
+        
+        print_info(f"{len(units)} translation units preprocess to {total_bytes / (1 << 20):.1f} MiB "
+                   f"over {len(headers)} distinct headers")
+        print_info("Headers by preprocessed bytes x including TUs (best PCH / forward-declaration targets):")
+        print(f"    {'score':>10}  {'TUs':>5}  {'size':>9}  header")
+        for info in ranking[:top]:
+            print(f"    {info['score'] / (1 << 20):8.1f}MB  {info['units']:5d}  "
+                  f"{info['bytes'] / 1024:7.1f}KB  {info['path']}")
+        print_success(f"Full ranking: {self._state_path('include_ranking.json')}")
+        return True
+    
+    def get_game_modules(self) -> List[str]:
+        """Game modules are the subdirectories of source/ with their own CMakeLists.txt"""
+        source_dir = self.root_dir / "source"
+        return sorted(child.name for child in source_dir.iterdir()
+                      if (child / "CMakeLists.txt").exists()) if source_dir.exists() else []
+    
+    def get_compile_times(self, target: str) -> Dict[str, float]:
+        """Last recorded compile duration of every object file of a CMake target"""
+        marker = f"CMakeFiles/{target}.dir/"
+        times = {}
+        if "Makefiles" in self._read_cmake_cache().get("CMAKE_GENERATOR", ""):
+            for edge in (self._load_state("make_timings.json") or {}).get("edges", []):
+                times[edge["outputs"][0]] = edge["end"] - edge["start"]
+        else:
+            for run in parse_ninja_log(self.build_dir / ".ninja_log"):
+                for edge in run:
+                    times[edge["outputs"][0]] = (edge["end"] - edge["start"]) / 1000.0
+        return {output: seconds for output, seconds in times.items()
+                if marker in output and output.endswith(OBJECT_SUFFIXES)}
+    
+    def select_pch_headers(self, module: str, ranking: dict, min_share: float = 0.5,
+                           max_headers: int = 8) -> List[str]:
+        """Choose the headers worth precompiling for a module
+        
+        Candidates are included by at least min_share of the module's TUs and
+        live outside the module (its own headers change too often), but are
+        included from the module's code. They are ranked by bytes saved; the
+        result keeps the order in which TUs include them.
+        """
+        module_dir = os.path.normpath(self.root_dir / "source" / module) + os.sep
+        generated_dir = os.path.normpath(self.root_dir / "_generated") + os.sep
+        units = [headers for unit, headers in ranking["units"].items() if unit.startswith(module_dir)]
+        if not units:
+            return []
+        
+        counts: Dict[str, int] = {}
+        for headers in units:
+            for header in headers:
+                counts[header] = counts.get(header, 0) + 1
+        info = {entry["path"]: entry for entry in ranking["headers"]}
+        
+        candidates = [
+            header for header, count in counts.items()
+            if count / len(units) >= min_share and header in info
+            and not header.startswith((module_dir, generated_dir))
+            and not header.endswith("stdc-predef.h")
+        ]
+        candidates.sort(key=lambda header: -info[header]["bytes"] * counts[header])
+        
+        # Only headers entered directly from the module's own code; anything
+        # deeper is an implementation detail of another header
+        chosen = [header for header in candidates
+                  if info[header].get("parent", "").startswith(module_dir)][:max_headers]
+        return sorted(chosen, key=lambda header: info[header]["position"])
+    
+    def generate_pch(self, modules: Optional[List[str]] = None, min_share: float = 0.5,
+                     max_headers: int = 8, min_units: int = 2, refresh: bool = False) -> bool:
+        """Generate target_precompile_headers() sets for game modules from measured include cost"""
+        print_header("Generating precompiled headers")
+        
+        ranking = None if refresh else self._load_state("include_ranking.json")
+        if not ranking:
+            if not self.analyze_includes(top=0, filter_text=str(self.root_dir / "source")):
+                return False
+            ranking = self._load_state("include_ranking.json")
+        
+        state = self._load_state("pch.json") or {}
+        changed = False
+        for module in modules or self.get_game_modules():
+            module_dir = os.path.normpath(self.root_dir / "source" / module) + os.sep
+            unit_count = sum(1 for unit in ranking["units"] if unit.startswith(module_dir))
+            headers = self.select_pch_headers(module, ranking, min_share, max_headers) \
+                if unit_count >= min_units else []
+            if unit_count < min_units:
+                print_info(f"{module}: {unit_count} translation unit(s), a PCH would not pay off")
+            
+            previous = state.get(module, {})
+            if headers == previous.get("headers", []):
+                print_info(f"{module}: PCH set unchanged ({len(headers)} headers)")
+                continue
+            
+            lines = ["# Generated by `zbuild.py pch` from measured include cost - do not edit", ""]
+            if headers:
+                lines.append(f"target_precompile_headers({module} PRIVATE")
+                lines.extend(f'    "{header}"' for header in headers)
+                lines.append(")")
+            self._write_if_changed(self._state_path("pch") / f"{module}.cmake", "\n".join(lines) + "\n")
+            
+            # Baseline for the before/after comparison made by the next build
+            state[module] = {
+                "headers": headers,
+                "generated": time.time(),
+                "before": self.get_compile_times(module),
+                "after": None,
+            }
+            changed = True
+            print_success(f"{module}: {len(headers)} precompiled headers")
+            for header in headers:
+                print(f"    {header}")
+        
+        self._save_state("pch.json", state)
+        self._report_codegen("pch")
+        # include(OPTIONAL) of a file that did not exist yet is not tracked by CMake
+        if changed and not self._reconfigure():
+            return False
+        return True
+    
+    def _report_pch_timings(self):
+        """Capture compile times after a PCH change and compare them with the baseline"""
+        state = self._load_state("pch.json") or {}
+        pending = [module for module, entry in state.items() if entry.get("after") is None]
+        if not pending:
+            return
+        
+        edges = self.get_last_build_edges()
+        for module in pending:
+            entry = state[module]
+            marker = f"CMakeFiles/{module}.dir/"
+            after = {edge["outputs"][0]: edge["end"] - edge["start"] for edge in edges
+                     if edge["start"] >= entry["generated"] and marker in edge["outputs"][0]
+                     and edge["outputs"][0].endswith(OBJECT_SUFFIXES)}
+            if not after:
+                continue
+            entry["after"] = after
+            
+            common = [output for output in after if output in entry["before"] and "cmake_pch" not in output]
+            before_total = sum(entry["before"][output] for output in common)
+            after_total = sum(after[output] for output in common)
+            pch_cost = sum(seconds for output, seconds in after.items() if "cmake_pch" in output)
+            if before_total > 0:
+                change = (after_total - before_total) / before_total * 100
+                print_info(f"{module} PCH: {len(common)} TUs compiled in {after_total:.1f}s "
+                           f"vs {before_total:.1f}s before ({change:+.0f}%), PCH build {pch_cost:.1f}s")
+        self._save_state("pch.json", state)
+    
+    def _game_sources(self) -> Dict[str, List[Path]]:
+        """Sources of every game module"""
+        sources = {}
+        for module in self.get_game_modules():
+            module_dir = self.root_dir / "source" / module
+            sources[module] = sorted(path for path in module_dir.rglob("*.cpp")
+                                     if not FINGERPRINT_SKIP_DIRS.intersection(path.relative_to(module_dir).parts))
+        return sources
+    
+    def _source_snapshot(self, previous: Dict[str, list]) -> Dict[str, list]:
+        """[size, mtime, content hash] of every game module source, rehashing only files whose stat changed"""
+        snapshot = {}
+        for module, sources in self._game_sources().items():
+            for path in sources:
+                key = f"{module}/{path.relative_to(self.root_dir / 'source' / module).as_posix()}"
+                stat = path.stat()
+                entry = previous.get(key)
+                if not entry or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+                    with open(path, "rb") as f:
+                        entry = [stat.st_size, stat.st_mtime_ns, hashlib.sha256(f.read()).hexdigest()]
+                snapshot[key] = entry
+        return snapshot
+    
+    def _record_source_times(self):
+        """Remember per-source compile times of game modules for sizing unity batches
+        
+        Also snapshots the sources of this successful build; sources that
+        differ from it later count as being edited. Sources edited for this
+        build stay hot, kept out of the batches, until they have gone
+        UNITY_HOT_BUILDS builds without an edit.
+        """
+        state = self._load_state("unity.json") or {}
+        recorded = state.get("times", {})
+        times = dict(recorded)
+        for module in self.get_game_modules():
+            for output, seconds in self.get_compile_times(module).items():
+                # Objects of unity batches and PCHs say nothing about single sources
+                name = output.split(".dir/", 1)[-1]
+                if name.startswith(("Unity/", "cmake_pch")):
+                    continue
+                source = os.path.splitext(name)[0]
+                times[f"{module}/{source}"] = seconds
+        previous = state.get("built")
+        built = self._source_snapshot(previous or {})
+        hot = {}
+        if previous is not None:
+            for key, entry in built.items():
+                if previous.get(key, [None])[-1] != entry[-1]:
+                    hot[key] = 0
+                elif key in state.get("hot", {}) and state["hot"][key] + 1 < UNITY_HOT_BUILDS:
+                    hot[key] = state["hot"][key] + 1
+        if times != recorded or built != previous or hot != state.get("hot", {}):
+            state.update(times=times, built=built, hot=hot)
+            self._save_state("unity.json", state)
+    
+    def generate_unity_batches(self, jobs: Optional[int] = None) -> bool:
+        """Group the sources of every game module into unity batches
+        
+        Batches are packed longest-first from recorded compile times so that
+        each takes about the same time and there are enough to keep every job
+        busy. Sources edited since the last successful build, or still hot
+        from an earlier edit, are left out; without such a build (a fresh
+        checkout) every source is batched. As long as the same sources are
+        batched, the previous batches are kept, so their objects stay valid.
+        """
+        jobs = jobs or os.cpu_count() or 1
+        state = self._load_state("unity.json") or {}
+        times = state.get("times", {})
+        known = sorted(times.values())
+        fallback = known[len(known) // 2] if known else UNITY_DEFAULT_SECONDS
+        built = state.get("built")
+        current = self._source_snapshot(built) if built is not None else {}
+        hot = state.get("hot", {})
+        previous_batches = state.get("batches", {})
+        kept_batches = {}
+        
+        changed = created = False
+        for module, sources in self._game_sources().items():
+            module_dir = self.root_dir / "source" / module
+            keys = {path: f"{module}/{path.relative_to(module_dir).as_posix()}" for path in sources}
+            recent = [path for path in sources if keys[path] in hot
+                      or built is not None and built.get(keys[path], [None])[-1] != current[keys[path]][-1]]
+            batched = [path for path in sources if path not in recent]
+            
+            # Repacking from fresh timings would move sources between batches
+            # and recompile them, so only repack when membership changed
+            by_key = {keys[path]: path for path in batched}
+            previous = previous_batches.get(module)
+            if previous is not None and sorted(key for batch in previous for key in batch) == sorted(by_key):
+                batches = [[by_key[key] for key in batch] for batch in previous]
+            else:
+                cost = {path: times.get(keys[path], fallback) for path in batched}
+                total = sum(cost.values())
+                # No batch can be shorter than the slowest source in it
+                target = max([total / jobs] + list(cost.values())) if cost else 0
+                count = max(1, round(total / target)) if target else 0
+                batches: List[List[Path]] = [[] for _ in range(count)]
+                loads = [0.0] * count
+                for path in sorted(batched, key=lambda path: -cost[path]):
+                    slot = loads.index(min(loads))
+                    batches[slot].append(path)
+                    loads[slot] += cost[path]
+            kept_batches[module] = [[keys[path] for path in batch] for batch in batches]
+            
+            lines = ["# Generated by `zbuild.py build --unity` from recorded compile times - do not edit", "",
+                     f"set_target_properties({module} PROPERTIES UNITY_BUILD ON UNITY_BUILD_MODE GROUP)"]
+            for index, batch in enumerate(batch for batch in batches if len(batch) > 1):
+                lines.append("set_source_files_properties(")
+                lines.extend(f'    "{path.as_posix()}"' for path in sorted(batch))
+                lines.append(f"    PROPERTIES UNITY_GROUP batch{index})")
+            singles = recent + [batch[0] for batch in batches if len(batch) == 1]
+            if singles:
+                lines.append("set_source_files_properties(")
+                lines.extend(f'    "{path.as_posix()}"' for path in sorted(singles))
+                lines.append("    PROPERTIES SKIP_UNITY_BUILD_INCLUSION ON)")
+            content = "\n".join(lines) + "\n"
+            
+            path = self._state_path("unity") / f"{module}.cmake"
+            existed = path.exists()
+            if not self._write_if_changed(path, content):
+                continue
+            created = created or not existed
+            changed = True
+            grouped = sum(len(batch) for batch in batches if len(batch) > 1)
+            print_info(f"{module}: {grouped} sources in {sum(1 for batch in batches if len(batch) > 1)} "
+                       f"unity batches, {len(singles)} built alone ({len(recent)} recently edited)")
+        
+        if kept_batches != previous_batches:
+            state["batches"] = kept_batches
+            self._save_state("unity.json", state)
+        self._report_codegen("unity")
+        if created and self._read_cmake_cache().get("Z_UNITY_BUILD", "OFF").upper() == "ON":
+            # CMake re-reads a changed batch file on its own, but not one that did not exist
+            return self._reconfigure()
+        if changed:
+            self._invalidate_build_stamp()
+        return True
+    
+    def precompile(self, parser: Path, params: Path, parser_input: Path, source_dir: Path,
+                   sys_include: str, module: str, include_dirs: Optional[List[Path]] = None,
+                   show_errors: str = "0", shards: Optional[int] = None, depfile: Optional[Path] = None) -> bool:
+        """Generate reflection code with ZParser, parsing only headers that changed
+        
+        A header changed when its content or that of any project header it
+        includes did. Headers are parsed in shards balanced by their previous
+        parse times, one ZParser process per shard. A partial parse replaces
+        the changed headers' outputs in _generated/reflection and leaves the
+        aggregate files alone. Every header is parsed, with the shards'
+        aggregate files merged in header order, when headers are added or
+        removed, when a changed header declares different types or
+        reflection macros, when a partial parse would add to an aggregate,
+        and without usable state or when the parser or its settings changed.
+        
+        A depfile, if asked for, lists every header the hashes read, so the
+        build runs precompile again when any of them changes.
+        """
+        with open(params, "r", encoding="utf-8") as f:
+            headers = [header.strip() for header in re.split(r"[;\n]", f.read()) if header.strip()]
+        reflected = self.filter_reflected_headers(headers)
+        if len(reflected) < len(headers):
+            print_info(f"Skipping {len(headers) - len(reflected)} of {len(headers)} headers without reflection markers")
+        headers = reflected
+        generated = source_dir.parent / "_generated" / "reflection"
+        include_dirs = [source_dir, *(include_dirs or [])]
+        hashes, closure = header_closure_hashes(headers, include_dirs)
+        if depfile:
+            # The depfile names the stamp the precompile command produces
+            write_depfile(depfile, depfile.with_suffix(""), closure)
+        
+        try:
+            parser_stat = parser.stat()
+        except OSError:
+            print_error(f"ZParser not found: {parser}")
+            return False
+        key = hashlib.sha256(json.dumps([str(parser), parser_stat.st_size, parser_stat.st_mtime_ns,
+                                         sys_include, module, show_errors]).encode()).hexdigest()[:16]
+        
+        # Outputs are attributed to headers by file stem, which must be unique
+        stems = [Path(header).stem for header in headers]
+        state = self._load_state("precompile.json") or {}
+        previous = state.get("headers") if state.get("key") == key and generated.is_dir() \
+            and parser_input.exists() and len(set(stems)) == len(stems) else None
+        
+        signatures = {header: previous[header].get("signature") for header in headers
+                      if previous and previous.get(header, {}).get("hash") == hashes[header]}
+        
+        def signature(header: str) -> Optional[str]:
+            if header not in signatures:
+                signatures[header] = reflection_signature(header)
+            return signatures[header]
+        
+        changed = list(headers)
+        if previous is not None:
+            changed = [header for header in headers if previous.get(header, {}).get("hash") != hashes[header]]
+            if not changed and set(previous) == set(headers):
+                print_info("Reflection code is up to date")
+                return True
+            # Partial runs leave the aggregate files alone, which only holds
+            # while the headers and the types they declare stay the same
+            if set(previous) != set(headers) or any(
+                    header not in previous or previous[header].get("signature") != signature(header)
+                    for header in changed):
+                print_info("Reflected headers or the types they declare changed")
+                previous = None
+        
+        times = dict(state.get("times", {}))
+        outputs = None
+        if previous is not None:
+            print_info(f"Parsing {len(changed)} of {len(headers)} headers")
+            stages = self._run_parser_shards(parser, self._plan_parser_shards(changed, times, shards), params.name,
+                                             parser_input.name, source_dir, sys_include, module, show_errors, times)
+            if stages is None:
+                self._save_state("precompile.json", {"times": times})
+                return False
+            outputs = self._apply_partial_parse(stages, changed, previous, generated, parser_input, source_dir)
+            if outputs is None:
+                print_info("The changed headers alter the aggregate files")
+        if outputs is None:
+            changed = list(headers)
+            print_info(f"Parsing all {len(headers)} headers")
+            stages = self._run_parser_shards(parser, self._plan_parser_shards(headers, times, shards), params.name,
+                                             parser_input.name, source_dir, sys_include, module, show_errors, times)
+            if stages is None:
+                self._save_state("precompile.json", {"times": times})
+                return False
+            outputs = self._apply_full_parse(stages, headers, generated, parser_input, source_dir)
+        self._report_codegen("reflection")
+        
+        self._save_state("precompile.json", {"key": key, "times": {
+            header: seconds for header, seconds in times.items() if header in hashes}, "headers": {
+            header: {"hash": hashes[header], "signature": signature(header),
+                     "outputs": outputs[header] if header in changed else previous[header]["outputs"]}
+            for header in headers}})
+        return True
+    
+    @staticmethod
+    def _read_stage_lines(path: Path, stage: Path, source_dir: Path) -> Optional[List[str]]:
+        """Lines of a file ZParser wrote in a stage, with the stage's source path mapped back"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stage_source = stage / source_dir.name
+                return f.read().replace(str(stage_source), str(source_dir)) \
+                    .replace(stage_source.as_posix(), source_dir.as_posix()).splitlines()
+        except OSError:
+            return None
+    
+    def _write_lines(self, path: Path, lines: List[str]):
+        self._write_if_changed(path, "".join(line + "\n" for line in lines))
+    
+    def _apply_full_parse(self, stages: List[Path], headers: List[str], generated: Path, parser_input: Path,
+                          source_dir: Path) -> Dict[str, List[str]]:
+        """Replace the generated reflection code with the stages' parse of every header
+        
+        Per-header files are taken from the stage that parsed the header;
+        files every stage writes are merged with merge_shard_lines. Returns
+        the generated files of each header.
+        """
+        outputs: Dict[str, List[str]] = {header: [] for header in headers}
+        written: Dict[str, List[List[str]]] = {}
+        for stage in stages:
+            staged = stage / "_generated" / "reflection"
+            for header, produced in self._attribute_reflection_outputs(staged, headers).items():
+                outputs[header] = sorted(set(outputs[header]) | set(produced))
+            for path in sorted(staged.iterdir()):
+                if path.is_file():
+                    written.setdefault(path.name, []).append(self._read_stage_lines(path, stage, source_dir) or [])
+        for name, shards in written.items():
+            self._write_lines(generated / name, merge_shard_lines(shards))
+        # ZParser owns the directory; what it did not write now is stale
+        for path in generated.iterdir() if generated.is_dir() else []:
+            if path.is_file() and path.name not in written:
+                path.unlink()
+        self._write_lines(parser_input, merge_shard_lines(
+            [self._read_stage_lines(stage / parser_input.name, stage, source_dir) or [] for stage in stages]))
+        return outputs
+    
+    def _apply_partial_parse(self, stages: List[Path], changed: List[str], previous: Dict[str, dict],
+                             generated: Path, parser_input: Path, source_dir: Path) -> Optional[Dict[str, List[str]]]:
+        """Install the per-header outputs of a parse of the changed headers
+        
+        The aggregate files are kept as they are. With the same headers and
+        types, everything the partial parse wrote into them must already be
+        there; if not, nothing is installed and None is returned so that every
+        header is parsed. Otherwise returns the generated files of each
+        changed header.
+        """
+        outputs: Dict[str, List[str]] = {header: [] for header in changed}
+        installs: Dict[str, Tuple[Path, Path]] = {}
+        for stage in stages:
+            staged = stage / "_generated" / "reflection"
+            for header, produced in self._attribute_reflection_outputs(staged, changed).items():
+                outputs[header] = sorted(set(outputs[header]) | set(produced))
+                installs.update((name, (staged / name, stage)) for name in produced)
+        for stage in stages:
+            staged = stage / "_generated" / "reflection"
+            aggregates = [(staged / path.name, generated / path.name) for path in staged.iterdir()
+                          if path.is_file() and path.name not in installs]
+            for written, existing in aggregates + [(stage / parser_input.name, parser_input)]:
+                lines = self._read_stage_lines(written, stage, source_dir)
+                if lines is None:
+                    continue
+                try:
+                    with open(existing, "r", encoding="utf-8") as f:
+                        known = set(f.read().splitlines())
+                except OSError:
+                    return None
+                if not known.issuperset(lines):
+                    return None
+        
+        for name, (path, stage) in sorted(installs.items()):
+            self._write_lines(generated / name, self._read_stage_lines(path, stage, source_dir))
+        for header in changed:
+            for name in previous[header]["outputs"]:
+                if name not in installs:
+                    (generated / name).unlink(missing_ok=True)
+        return outputs
+    
+    def filter_reflected_headers(self, headers: List[str]) -> List[str]:
+        """Headers containing reflection markers, scanning only files whose content changed
+        
+        Verdicts are cached by content hash, and hashes by (size, mtime), so an
+        unchanged header costs one stat.
+        """
+        state = self._load_state("prefilter.json") or {}
+        stats, verdicts = state.get("stats", {}), state.get("verdicts", {})
+        new_stats: Dict[str, list] = {}
+        new_verdicts: Dict[str, bool] = {}
+        reflected = []
+        for header in headers:
+            try:
+                stat = os.stat(header)
+            except OSError:
+                reflected.append(header)
+                continue
+            cached = stats.get(header)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns \
+                    and cached[2] in verdicts:
+                digest, verdict = cached[2], verdicts[cached[2]]
+            else:
+                digest, verdict = scan_reflection_markers(header, verdicts)
+                if digest is None:
+                    reflected.append(header)
+                    continue
+            new_stats[header] = [stat.st_size, stat.st_mtime_ns, digest]
+            new_verdicts[digest] = verdict
+            if verdict:
+                reflected.append(header)
+        if new_stats != stats or new_verdicts != verdicts:
+            self._save_state("prefilter.json", {"stats": new_stats, "verdicts": new_verdicts})
+        return reflected
+    
+    def _plan_parser_shards(self, headers: List[str], times: Dict[str, float],
+                            shards: Optional[int] = None) -> List[List[str]]:
+        """Split headers into ZParser shards of about equal parse time
+        
+        Shards are consecutive runs of the header list, so their aggregate
+        files merge back in header order. Headers without a recorded parse
+        time are estimated from their size at the rate seen for the others.
+        """
+        sizes = {}
+        for header in headers:
+            try:
+                sizes[header] = os.path.getsize(header)
+            except OSError:
+                sizes[header] = 0
+        timed = [header for header in headers if header in times]
+        rate = sum(times[header] for header in timed) / max(1, sum(sizes[header] for header in timed)) \
+            if timed else 1.0
+        costs = {header: times.get(header, sizes[header] * rate) for header in headers}
+        
+        count = shards or min(os.cpu_count() or 1, max(1, len(headers) // PRECOMPILE_SHARD_MIN_HEADERS))
+        count = max(1, min(count, len(headers)))
+        total = sum(costs.values())
+        batches: List[List[str]] = [[]]
+        done = 0.0
+        for index, header in enumerate(headers):
+            # Move on to the next shard once this header would mostly fall past
+            # the current one's share, keeping a header for every shard to come
+            left = count - len(batches)
+            if batches[-1] and left and (done + costs[header] / 2 > total * len(batches) / count
+                                         or len(headers) - index == left):
+                batches.append([])
+            batches[-1].append(header)
+            done += costs[header]
+        return batches
+    
+    def _run_parser_shards(self, parser: Path, batches: List[List[str]], params_name: str, input_name: str,
+                           source_dir: Path, sys_include: str, module: str, show_errors: str,
+                           times: Dict[str, float]) -> Optional[List[Path]]:
+        """Run one ZParser per shard, each in a staging tree of its own
+        
+        ZParser writes next to the source directory it is given, so every
+        stage links (or copies) the project sources. Each shard's parse time
+        is shared out over its headers by size for the next planning.
+        """
+        root = self._state_path("precompile")
+        shutil.rmtree(root, ignore_errors=True)
+        stages = []
+        for index, batch in enumerate(batches):
+            stage = root / f"shard{index}"
+            (stage / "_generated" / "reflection").mkdir(parents=True)
+            try:
+                os.symlink(source_dir, stage / source_dir.name, target_is_directory=True)
+            except OSError:
+                shutil.copytree(source_dir, stage / source_dir.name)
+            with open(stage / params_name, "w", encoding="utf-8") as f:
+                f.write(";".join(batch))
+            stages.append(stage)
+        if len(batches) > 1:
+            print_info(f"Running {len(batches)} ZParser shards of {', '.join(str(len(b)) for b in batches)} headers")
+        
+        def run(index: int) -> Tuple[int, float]:
+            stage = stages[index]
+            start = time.time()
+            returncode = subprocess.run([str(parser), str(stage / params_name), str(stage / input_name),
+                                         str(stage / source_dir.name), sys_include, module, show_errors]).returncode
+            return returncode, time.time() - start
+        
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+            results = list(pool.map(run, range(len(batches))))
+        
+        for batch, (returncode, duration) in zip(batches, results):
+            sizes = {header: os.path.getsize(header) if os.path.exists(header) else 0 for header in batch}
+            total = sum(sizes.values()) or len(batch)
+            for header in batch:
+                times[header] = duration * (sizes[header] or total / len(batch)) / total
+        if any(returncode != 0 for returncode, _ in results):
+            print_error("ZParser failed")
+            return None
+        return stages
+    
+    @staticmethod
+    def _attribute_reflection_outputs(generated: Path, headers: List[str]) -> Dict[str, List[str]]:
+        """Generated files belonging to each header, named <header stem>.<anything>"""
+        try:
+            names = sorted(path.name for path in generated.iterdir() if path.is_file())
+        except OSError:
+            names = []
+        return {header: [name for name in names if name.startswith(Path(header).stem + ".")]
+                for header in headers}
+    
+    def get_last_build_edges(self) -> List[dict]:
+        """Timed edges of the last native build, with absolute start/end in seconds
+        
+        Ninja runs are read from .ninja_log and aligned with the recorded
+        build attempts; Makefile builds use timings parsed from make output.
+        """
+        if "Makefiles" in self._read_cmake_cache().get("CMAKE_GENERATOR", ""):
+            return (self._load_state("make_timings.json") or {}).get("edges", [])
+        
+        runs = parse_ninja_log(self.build_dir / ".ninja_log")
+        attempts = (self._load_state("build_report.json") or {}).get("attempts", [])
+        if not runs or not attempts:
+            return []
+        # Ninja runs that had nothing to do leave no entries, so only align
+        # every attempt when the counts agree
+        pairs = list(zip(runs[-len(attempts):], attempts)) if len(runs) >= len(attempts) \
+            else [(runs[-1], attempts[-1])]
+        edges = []
+        for run, attempt in pairs:
+            for edge in run:
+                edges.append({"start": attempt["started"] + edge["start"] / 1000.0,
+                              "end": attempt["started"] + edge["end"] / 1000.0,
+                              "outputs": edge["outputs"]})
+        return edges
+    
+    def write_trace(self, path: Path) -> bool:
+        """Export the last build as a Chrome/Perfetto trace
+        
+        Native build edges get one track per parallel slot; zbuild's own
+        phases (requirement check, configure, precompile, build, install)
+        leading up to and following the last build go on a separate track.
+        """
+        edges = self.get_last_build_edges()
+        phases = (self._load_state("phases.json") or {}).get("phases", [])
+        
+        # Keep the phases since the build before the most recent one
+        builds = [i for i, phase in enumerate(phases) if phase["name"] == "build"]
+        if len(builds) >= 2:
+            first = builds[-2] + 1
+            # OOM retries record several consecutive build phases
+            while first in builds:
+                first += 1
+            phases = phases[first:]
+        
+        # The ZParser custom command runs inside the native build
+        for edge in edges:
+            if any(".precompile_stamp" in output or "running meta parser" in output.lower()
+                   for output in edge["outputs"]):
+                phases.append({"name": "precompile", "start": edge["start"], "end": edge["end"]})
+        
+        if not edges and not phases:
+            print_warning("No build timings recorded yet, nothing to trace")
+            return False
+        
+        origin = min([edge["start"] for edge in edges] + [phase["start"] for phase in phases])
+        
+        def to_us(seconds: float) -> int:
+            return int((seconds - origin) * 1e6)
+        
+        events = [
+            {"ph": "M", "pid": 0, "name": "process_name", "args": {"name": "zbuild"}},
+            {"ph": "M", "pid": 1, "name": "process_name", "args": {"name": "native build"}},
+        ]
+        for phase in phases:
+            events.append({"ph": "X", "pid": 0, "tid": 0, "cat": "zbuild", "name": phase["name"],
+                           "ts": to_us(phase["start"]), "dur": to_us(phase["end"]) - to_us(phase["start"])})
+        slots = assign_slots(edges)
+        for slot in sorted(set(slots)):
+            events.append({"ph": "M", "pid": 1, "tid": slot, "name": "thread_name",
+                           "args": {"name": f"slot {slot}"}})
+        for edge, slot in zip(edges, slots):
+            events.append({"ph": "X", "pid": 1, "tid": slot, "cat": "edge", "name": edge["outputs"][0],
+                           "ts": to_us(edge["start"]), "dur": to_us(edge["end"]) - to_us(edge["start"]),
+                           "args": {"outputs": edge["outputs"]}})
+        
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        except OSError as e:
+            print_error(f"Failed to write trace: {e}")
+            return False
+        
+        print_success(f"Wrote build trace with {len(edges)} edges on {len(set(slots))} slots to {path}")
+        return True
+    
+    def analyze_build(self, top: int = 10, json_path: Optional[str] = None) -> bool:
+        """Report critical path, parallelism and serialising targets of the last build"""
+        print_header("Analyzing last build")
+        
+        edges = self.get_last_build_edges()
+        if not edges:
+            print_error("No timings recorded for the last build; run `zbuild.py build` first")
+            return False
+        
+        # Utilisation of the last build
+        cores = os.cpu_count() or 1
+        wall = max(edge["end"] for edge in edges) - min(edge["start"] for edge in edges)
+        busy = sum(edge["end"] - edge["start"] for edge in edges)
+        parallelism = busy / wall if wall > 0 else 0.0
+        idle = max(0.0, cores * wall - busy)
+        
+        # Attribute stretches where at most one job ran to the running targets
+        serial: Dict[str, float] = {}
+        points = sorted([(edge["start"], 1, i) for i, edge in enumerate(edges)] +
+                        [(edge["end"], -1, i) for i, edge in enumerate(edges)])
+        running = set()
+        previous = points[0][0]
+        for timestamp, delta, index in points:
+            if len(running) == 1 and timestamp > previous:
+                target = edge_target(edges[next(iter(running))]["outputs"][0])
+                serial[target] = serial.get(target, 0.0) + timestamp - previous
+            previous = timestamp
+            if delta > 0:
+                running.add(index)
+            else:
+                running.discard(index)
+        
+        report = {
+            "wall_seconds": wall,
+            "edges": len(edges),
+            "busy_core_seconds": busy,
+            "cores": cores,
+            "average_parallelism": parallelism,
+            "idle_core_seconds": idle,
+            "serial_seconds_by_target": serial,
+        }
+        
+        print_info(f"Last build: {wall:.1f}s wall, {len(edges)} edges, {busy:.1f} busy core-seconds")
+        print_info(f"Average parallelism: {parallelism:.1f} of {cores} cores")
+        print_info(f"Idle core-seconds: {idle:.1f} ({idle / (cores * wall) * 100 if wall else 0:.0f}% of capacity)")
+        
+        critical_path = self._ninja_critical_path()
+        if critical_path is None:
+            print_warning("Critical path needs the Ninja dependency graph; not available for this generator")
+        else:
+            length = sum(duration for _, duration in critical_path)
+            by_target: Dict[str, float] = {}
+            for output, duration in critical_path:
+                target = edge_target(output)
+                by_target[target] = by_target.get(target, 0.0) + duration
+            report["critical_path_seconds"] = length
+            report["critical_path"] = [{"output": output, "seconds": duration}
+                                       for output, duration in critical_path]
+            report["critical_path_seconds_by_target"] = by_target
+            
+            print_info(f"Critical path: {length:.1f}s over {len(critical_path)} edges")
+            if length > 0 and wall > 0:
+                bound = "graph-bound" if length >= 0.8 * wall else "core-bound"
+                print_info(f"More cores can speed this build up by at most {wall / length:.2f}x ({bound})")
+            print_info("Critical path by target:")
+            for target, seconds in sorted(by_target.items(), key=lambda item: -item[1])[:top]:
+                print(f"    {seconds:8.2f}s  {target}")
+            print_info("Longest edges on the critical path:")
+            for output, duration in sorted(critical_path, key=lambda item: -item[1])[:top]:
+                print(f"    {duration:8.2f}s  {output}")
+        
+        if serial:
+            print_info("Time with at most one job running, by target:")
+            for target, seconds in sorted(serial.items(), key=lambda item: -item[1])[:top]:
+                print(f"    {seconds:8.2f}s  {target}")
+        
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print_success(f"Wrote analysis to {json_path}")
+        return True
+    
+    def _ninja_critical_path(self) -> Optional[List[Tuple[str, float]]]:
+        """Longest chain of dependent edges, weighted by their last recorded durations
+        
+        Durations come from the most recent .ninja_log entry of every output,
+        so edges that were up to date in the last build still count with
+        their last known cost.
+        """
+        make_program = self._read_cmake_cache().get("CMAKE_MAKE_PROGRAM")
+        if not make_program or Path(make_program).stem.lower() != "ninja":
+            return None
+        result = subprocess.run([make_program, "-C", str(self.build_dir), "-t", "graph"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print_warning(f"ninja -t graph failed: {result.stderr.strip()}")
+            return None
+        inputs_of = parse_ninja_graph(result.stdout)
+        
+        durations: Dict[str, float] = {}
+        edge_of: Dict[str, str] = {}
+        outputs_of: Dict[str, List[str]] = {}
+        for run in parse_ninja_log(self.build_dir / ".ninja_log"):
+            for edge in run:
+                key = edge["outputs"][0]
+                durations[key] = (edge["end"] - edge["start"]) / 1000.0
+                outputs_of[key] = edge["outputs"]
+                for output in edge["outputs"]:
+                    edge_of[output] = key
+        
+        # Timed edges each depends on, looking through phony/untimed edges
+        untimed_memo: Dict[str, set] = {}
+        
+        def timed_dependencies(path: str, stack: set) -> set:
+            if path in untimed_memo:
+                return untimed_memo[path]
+            found = set()
+            stack.add(path)
+            for source in inputs_of.get(path, []):
+                if source in edge_of:
+                    found.add(edge_of[source])
+                elif source in inputs_of and source not in stack:
+                    found |= timed_dependencies(source, stack)
+            stack.discard(path)
+            untimed_memo[path] = found
+            return found
+        
+        dependencies: Dict[str, set] = {}
+        for key in durations:
+            deps = set()
+            for output in outputs_of[key]:
+                for source in inputs_of.get(output, []):
+                    if source in edge_of:
+                        deps.add(edge_of[source])
+                    elif source in inputs_of:
+                        deps |= timed_dependencies(source, set())
+            deps.discard(key)
+            dependencies[key] = deps
+        
+        # Longest path by iterative post-order DFS
+        longest: Dict[str, float] = {}
+        via: Dict[str, Optional[str]] = {}
+        visiting = set()
+        for root in durations:
+            stack = [(root, False)]
+            while stack:
+                key, expanded = stack.pop()
+                if key in longest:
+                    continue
+                if not expanded:
+                    if key in visiting:
+                        continue  # breaks accidental cycles
+                    visiting.add(key)
+                    stack.append((key, True))
+                    stack.extend((dep, False) for dep in dependencies[key] if dep not in longest)
+                    continue
+                best = max(dependencies[key], key=lambda dep: longest.get(dep, 0.0), default=None)
+                longest[key] = durations[key] + (longest.get(best, 0.0) if best else 0.0)
+                via[key] = best
+        
+        if not longest:
+            return []
+        key = max(longest, key=longest.get)
+        path = []
+        while key:
+            path.append((key, durations[key]))
+            key = via.get(key)
+        path.reverse()
+        return path
+    
+    def benchmark_noop_build(self, config: str = "debug", preset: Optional[str] = None,
+                             runs: int = 10, budget_ms: float = 200.0) -> bool:
+        """Measure end-to-end latency of an up-to-date `zbuild.py build` against a budget"""
+        print_header("Benchmarking no-op build")
+        
+        cmd = [sys.executable, str(ZBUILD_SCRIPT), "build", "--config", config]
+        if preset:
+            cmd.extend(["--preset", preset])
+        
+        if os.environ.get("PYTHONDONTWRITEBYTECODE"):
+            print_warning("PYTHONDONTWRITEBYTECODE is set, so every run compiles zbuild_core from source")
+        
+        # Warm-up build so the timed runs start from an up-to-date tree
+        print_info(f"Running: {' '.join(cmd)}")
+        if subprocess.run(cmd, cwd=self.root_dir).returncode != 0:
+            print_error("Warm-up build failed")
+            return False
+        
+        timings = []
+        for _ in range(max(1, runs)):
+            start = time.perf_counter()
+            result = subprocess.run(cmd, cwd=self.root_dir, capture_output=True, text=True)
+            timings.append((time.perf_counter() - start) * 1000.0)
+            if result.returncode != 0:
+                print_error("No-op build failed")
+                return False
+            if "Build is up to date" not in result.stdout:
+                print_warning("Build was not a no-op; inputs changed during the benchmark")
+        
+        timings.sort()
+        median = timings[len(timings) // 2]
+        print_info(f"No-op build over {len(timings)} runs: "
+                   f"min {timings[0]:.1f} ms, median {median:.1f} ms, max {timings[-1]:.1f} ms")
+        
+        if median > budget_ms:
+            print_error(f"Median no-op latency {median:.1f} ms exceeds budget of {budget_ms:.0f} ms")
+            return False
+        
+        print_success(f"No-op latency within budget of {budget_ms:.0f} ms")
+        return True
+    
+    def clean(self, all_trees: bool = False) -> bool:
+        """Clean build artifacts of the current build tree, or of every tree"""
+        print_header("Cleaning build directory")
+        
+        build_dir = self.build_root if all_trees else self.build_dir
+        if build_dir.exists():
+            print_info(f"Removing: {build_dir}")
+            try:
+                shutil.rmtree(build_dir)
+                print_success("Build directory cleaned")
+                return True
+            except Exception as e:
+                print_error(f"Failed to clean: {e}")
+                return False
+        else:
+            print_info("Build directory does not exist, nothing to clean")
+            return True
+    
+    def install(self, config: Optional[str] = None, trace: Optional[str] = None) -> bool:
+        """Install the built artifacts"""
+        print_header("Installing ZEngineDemo")
+        
+        cmd = ["cmake", "--install", str(self.build_dir)]
+        
+        if self.is_windows:
+            config_map = {
+                "debug": "Debug",
+                "release": "Release",
+                "relwithdebinfo": "RelWithDebInfo"
+            }
+            cmd.extend(["--config", config_map.get((config or "release").lower(), "Release")])
+        
+        print_info(f"Running: {' '.join(cmd)}")
+        with self._phase("install"):
+            result = subprocess.run(cmd, cwd=self.root_dir)
+        
+        if result.returncode != 0:
+            print_error("Installation failed")
+            return False
+        
+        print_success("Installation completed successfully")
+        if trace:
+            self.write_trace(Path(trace))
+        return True
+    
+    def test(self) -> bool:
+        """Run tests"""
+        print_header("Running tests")
+        
+        cmd = ["ctest", "--test-dir", str(self.build_dir), "--output-on-failure"]
+        
+        print_info(f"Running: {' '.join(cmd)}")
+        result = subprocess.run(cmd, cwd=self.root_dir)
+        
+        if result.returncode != 0:
+            print_error("Tests failed")
+            return False
+        
+        print_success("All tests passed")
+        return True
+    
+    def list_presets(self):
+        """List available CMake presets"""
+        print_header("Available CMake Presets")
+        
+        cmd = ["cmake", "--list-presets"]
+        result = subprocess.run(cmd, cwd=self.root_dir, capture_output=True, text=True)
+        
+        if result.returncode == 0:
+            print(result.stdout)
+        else:
+            print_error("Failed to list presets")
+    
+    def show_info(self):
+        """Show build system information"""
+        print_header("ZEngineDemo Build System Information")
+        print_info(f"Root directory: {self.root_dir}")
+        print_info(f"Build directory: {self.build_dir}")
+        print_info(f"Platform: {self.system}")
+        print_info(f"Python: {sys.version}")
+        
+        # Check CMake version
+        cmake_version = self._check_command("cmake", "--version")
+        if cmake_version:
+            print_info(f"CMake: {cmake_version}")
+
+
+BUILD_CONFIGS = ['debug', 'release', 'relwithdebinfo']
+
+
+def config_list(value: str) -> List[str]:
+    """argparse type for one or more comma-separated build configurations"""
+    configs = [part.strip().lower() for part in value.split(",") if part.strip()]
+    unknown = [config for config in configs if config not in BUILD_CONFIGS]
+    if not configs or unknown:
+        raise argparse.ArgumentTypeError(f"invalid configuration(s) {', '.join(unknown) or value!r}, "
+                                         f"choose from {', '.join(BUILD_CONFIGS)}")
+    return list(dict.fromkeys(configs))
+
+
+def child_build_args(args: argparse.Namespace) -> List[str]:
+    """Build options passed on to the child builds of a multi-build command"""
+    extra_args = ["--job-policy", args.job_policy]
+    if args.target:
+        extra_args.extend(["--target", args.target])
+    if args.mem_per_job:
+        extra_args.extend(["--mem-per-job", str(args.mem_per_job)])
+    for flag in ("force", "time_trace", "unity"):
+        if getattr(args, flag, False):
+            extra_args.append("--" + flag.replace("_", "-"))
+    return extra_args
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="ZEngineDemo Build System - Unified build tool for all platforms",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  zbuild.py configure                  # Configure with default settings
+  zbuild.py configure --config release # Configure for release
+  zbuild.py build                      # Build the project
+  zbuild.py build --target ZEngineDemo     # Build specific target
+  zbuild.py build --jobs 8             # Build with 8 parallel jobs
+  zbuild.py build --force              # Build even if nothing changed
+  zbuild.py build --config debug,release # Build both configurations at once
+  zbuild.py matrix --presets linux_make_debug,linux_make_release  # Build presets together
+  zbuild.py build --trace trace.json   # Export a Chrome/Perfetto build trace
+  zbuild.py analyze-build              # Critical path of the last build
+  zbuild.py analyze-includes           # Rank headers by inclusion cost
+  zbuild.py pch                        # Generate PCHs for game modules
+  zbuild.py store                      # List shared engine builds
+  zbuild.py bench --budget-ms 200      # Check no-op build latency
+  zbuild.py clean                      # Clean build directory
+  zbuild.py test                       # Run tests
+  zbuild.py install                    # Install built artifacts
+  zbuild.py daemon --background        # Keep build state warm between commands
+        """
+    )
+    
+    subparsers = parser.add_subparsers(dest='command', help='Command to execute')
+    
+    # Configure command
+    configure_parser = subparsers.add_parser('configure', help='Configure the build system')
+    configure_parser.add_argument('--config', choices=['debug', 'release', 'relwithdebinfo'],
+                                 default='debug', help='Build configuration')
+    configure_parser.add_argument('--generator', choices=['ninja', 'make', 'xcode', 'vs'],
+                                 help='CMake generator to use')
+    configure_parser.add_argument('--link-jobs', type=int, metavar='N',
+                                 help='Size of the Ninja link pool (default: from memory and measured link RSS)')
+    configure_parser.add_argument('--preset', help='Use specific CMake preset')
+    configure_parser.add_argument('--force', action='store_true',
+                                 help='Run CMake even if no configure input changed')
+    configure_parser.add_argument('--profile', action='store_true',
+                                 help='Profile CMake and report the most expensive commands and files')
+    configure_parser.add_argument('--engine', choices=['auto', 'source', 'prebuilt'], default='auto',
+                                 help='Build the engine from source or use a matching prebuilt install '
+                                      '(auto: prebuilt when one exists)')
+    configure_parser.add_argument('--extra-args', nargs=argparse.REMAINDER, help='Extra CMake arguments')
+    
+    # Build command
+    build_parser = subparsers.add_parser('build', help='Build the project')
+    build_parser.add_argument('--config', type=config_list, default=['debug'],
+                             help='Build configuration; a comma-separated list builds several at once '
+                                  '(debug, release, relwithdebinfo)')
+    build_parser.add_argument('--target', help='Specific target to build')
+    build_parser.add_argument('--jobs', type=int, help='Number of parallel jobs')
+    build_parser.add_argument('--preset', help='Use specific build preset, or build the tree of a configure preset')
+    build_parser.add_argument('--force', action='store_true',
+                             help='Run the build tool even if no input changed')
+    build_parser.add_argument('--job-policy', choices=['memory', 'cpu'], default='memory',
+                             help='How --jobs is chosen when omitted (default: memory)')
+    build_parser.add_argument('--mem-per-job', type=int, metavar='MB',
+                             help='Override the measured memory per compile job')
+    build_parser.add_argument('--jobserver', action='store_true',
+                             help='Host a pressure-adaptive jobserver shared by all nested tools (Linux)')
+    build_parser.add_argument('--trace', metavar='FILE',
+                             help='Write a Chrome/Perfetto trace of the build to FILE')
+    build_parser.add_argument('--time-trace', action='store_true',
+                             help='Compile with clang -ftime-trace and aggregate the results')
+    build_parser.add_argument('--workspace', action='store_true',
+                             default=os.environ.get("ZBUILD_WORKSPACE") == "1",
+                             help='Build the engine once in a tree shared with other projects and use it '
+                                  'from there; sticks to the build tree (default from ZBUILD_WORKSPACE=1)')
+    build_parser.add_argument('--unity', action='store_true',
+                             help='Compile game modules as unity batches sized from recorded compile times')
+    
+    # Link launcher, installed by configure as CMAKE_<LANG>_LINKER_LAUNCHER
+    link_parser = subparsers.add_parser('link-launcher', help='Run a link command and record its peak memory')
+    link_parser.add_argument('--record', required=True, help='JSON lines file the sample is appended to')
+    link_parser.add_argument('link_command', nargs=argparse.REMAINDER, help='Link command line')
+    
+    # Compile launcher, installed by configure as CMAKE_<LANG>_COMPILER_LAUNCHER
+    # and run by zbuild.py without loading the rest of zbuild
+    compile_parser = subparsers.add_parser('compile-launcher', help='Run a compile command and record its peak memory')
+    compile_parser.add_argument('--record', required=True, help='JSON lines file the sample is appended to')
+    compile_parser.add_argument('compile_command', nargs=argparse.REMAINDER, help='Compile command line')
+    
+    # Incremental reflection generation, run by the precompile custom command
+    precompile_parser = subparsers.add_parser('precompile', help='Generate reflection code for changed headers')
+    precompile_parser.add_argument('--build-dir', required=True, help='Build tree the state belongs to')
+    precompile_parser.add_argument('--parser', required=True, help='ZParser executable')
+    precompile_parser.add_argument('--params', required=True, help='Header list written by configure')
+    precompile_parser.add_argument('--parser-input', required=True, help='Include list written by ZParser')
+    precompile_parser.add_argument('--source-dir', required=True, help='Project source directory')
+    precompile_parser.add_argument('--sys-include', default='*', help='System include directory for ZParser')
+    precompile_parser.add_argument('--module', required=True, help='Module name passed to ZParser')
+    precompile_parser.add_argument('--include-dirs', nargs='*', default=[],
+                                   help='Directories project headers are included from')
+    precompile_parser.add_argument('--shards', type=int,
+                                   help='Number of parallel ZParser processes '
+                                        '(default: from header count and cores)')
+    precompile_parser.add_argument('--depfile',
+                                   help='Write a depfile of the headers read for the output named like it without .d')
+    
+    # Matrix command
+    matrix_parser = subparsers.add_parser('matrix', help='Build several presets together under one job budget')
+    matrix_parser.add_argument('--presets', type=lambda value: [p.strip() for p in value.split(",") if p.strip()],
+                              required=True, help='Comma-separated configure presets, started in this order')
+    matrix_parser.add_argument('--target', help='Specific target to build')
+    matrix_parser.add_argument('--jobs', type=int, help='Total number of parallel jobs')
+    matrix_parser.add_argument('--force', action='store_true',
+                              help='Run the build tools even if no input changed')
+    matrix_parser.add_argument('--job-policy', choices=['memory', 'cpu'], default='memory',
+                              help='How --jobs is chosen when omitted (default: memory)')
+    matrix_parser.add_argument('--mem-per-job', type=int, metavar='MB',
+                              help='Override the measured memory per compile job')
+    matrix_parser.add_argument('--unity', action='store_true',
+                              help='Compile game modules as unity batches')
+    
+    # Benchmark command
+    bench_parser = subparsers.add_parser('bench', help='Benchmark no-op build latency')
+    bench_parser.add_argument('--config', choices=['debug', 'release', 'relwithdebinfo'],
+                             default='debug', help='Build configuration')
+    bench_parser.add_argument('--preset', help='Use specific build preset')
+    bench_parser.add_argument('--runs', type=int, default=10, help='Number of timed runs')
+    bench_parser.add_argument('--budget-ms', type=float, default=200.0,
+                             help='Maximum median no-op latency in milliseconds')
+    
+    # Clean command
+    clean_parser = subparsers.add_parser('clean', help='Clean build artifacts')
+    clean_parser.add_argument('--all', action='store_true', dest='all_trees',
+                             help='Remove every build tree, not just the one used last')
+    
+    # Install command
+    install_parser = subparsers.add_parser('install', help='Install built artifacts')
+    install_parser.add_argument('--config', choices=['debug', 'release', 'relwithdebinfo'],
+                               help='Build configuration (default: the build tree used last)')
+    install_parser.add_argument('--trace', metavar='FILE',
+                               help='Write a Chrome/Perfetto trace of the last build and install to FILE')
+    
+    # Test command
+    subparsers.add_parser('test', help='Run tests')
+    
+    # Info command
+    subparsers.add_parser('info', help='Show build system information')
+    
+    # List presets command
+    subparsers.add_parser('list-presets', help='List available CMake presets')
+    
+    # Check command
+    subparsers.add_parser('check', help='Check build requirements')
+    
+    # Analyze build command
+    analyze_parser = subparsers.add_parser('analyze-build',
+                                           help='Critical path and parallelism analysis of the last build')
+    analyze_parser.add_argument('--top', type=int, default=10, help='Number of entries per table')
+    analyze_parser.add_argument('--json', metavar='FILE', help='Also write the analysis as JSON')
+    
+    # Analyze includes command
+    includes_parser = subparsers.add_parser('analyze-includes',
+                                            help='Rank headers by inclusion cost from compile_commands.json')
+    includes_parser.add_argument('--top', type=int, default=25, help='Number of headers to show')
+    includes_parser.add_argument('--filter', help='Only analyze translation units whose path contains this text')
+    includes_parser.add_argument('--jobs', type=int, help='Number of parallel preprocessor runs')
+    
+    # Engine store command
+    store_parser = subparsers.add_parser('store', help='List or trim the shared engine artifact store')
+    store_parser.add_argument('--max-size', type=float,
+                              help='Evict least recently used engine builds down to this size (GiB)')
+    
+    # PCH command
+    pch_parser = subparsers.add_parser('pch', help='Generate precompiled headers for game modules')
+    pch_parser.add_argument('--module', action='append', help='Game module to process (default: all)')
+    pch_parser.add_argument('--min-share', type=float, default=0.5,
+                            help='Minimum fraction of a module\'s TUs that must include a header')
+    pch_parser.add_argument('--max-headers', type=int, default=8, help='Maximum headers per PCH')
+    pch_parser.add_argument('--refresh', action='store_true',
+                            help='Re-measure include costs before selecting headers')
+    
+    # Daemon command
+    daemon_parser = subparsers.add_parser('daemon', help='Run a persistent build server')
+    daemon_group = daemon_parser.add_mutually_exclusive_group()
+    daemon_group.add_argument('--background', action='store_true',
+                              help='Start the daemon detached from the terminal')
+    daemon_group.add_argument('--stop', action='store_true', help='Stop a running daemon')
+    daemon_group.add_argument('--status', action='store_true',
+                              help='Show daemon status and build history')
+    
+    return parser
+
+
+def run_command(build_system: BuildSystem, args: argparse.Namespace) -> int:
+    """Execute a parsed command against a build system instance"""
+    try:
+        # Work on the tree of the preset or configuration the command names,
+        # otherwise on the one used last
+        config = getattr(args, 'config', None)
+        if isinstance(config, list):
+            config = config[0] if len(config) == 1 else None
+        preset = getattr(args, 'preset', None)
+        if preset or config:
+            build_system.use_build_dir(build_system.resolve_build_dir(
+                config, preset, getattr(args, 'generator', None),
+                kind="configure" if args.command == 'configure' else "build"))
+        else:
+            build_system.use_build_dir()
+        
+        if args.command == 'check':
+            if not build_system.check_requirements():
+                return 1
+            return 0
+        
+        if args.command == 'info':
+            build_system.show_info()
+            return 0
+        
+        if args.command == 'list-presets':
+            build_system.list_presets()
+            return 0
+        
+        # Check requirements for other commands
+        if not build_system.check_requirements():
+            print_warning("Some requirements are missing, but continuing anyway...")
+        
+        if args.command == 'configure':
+            success = build_system.configure(
+                config=args.config,
+                generator=args.generator,
+                preset=args.preset,
+                extra_args=args.extra_args,
+                force=args.force,
+                profile=args.profile,
+                engine=args.engine,
+                link_jobs=args.link_jobs
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'build' and len(args.config) > 1:
+            if args.preset or args.trace:
+                print_error("--preset and --trace apply to a single configuration")
+                return 1
+            success = build_system.build_configs(
+                args.config,
+                jobs=args.jobs,
+                job_policy=args.job_policy,
+                mem_per_job=args.mem_per_job * (1 << 20) if args.mem_per_job else None,
+                extra_args=child_build_args(args)
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'matrix':
+            success = build_system.build_matrix(
+                args.presets,
+                jobs=args.jobs,
+                job_policy=args.job_policy,
+                mem_per_job=args.mem_per_job * (1 << 20) if args.mem_per_job else None,
+                extra_args=child_build_args(args)
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'build':
+            success = build_system.build(
+                config=args.config[0],
+                target=args.target,
+                jobs=args.jobs,
+                preset=args.preset,
+                force=args.force,
+                job_policy=args.job_policy,
+                mem_per_job=args.mem_per_job * (1 << 20) if args.mem_per_job else None,
+                jobserver=args.jobserver,
+                trace=args.trace,
+                time_trace=args.time_trace,
+                unity=args.unity,
+                workspace=args.workspace
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'analyze-build':
+            success = build_system.analyze_build(top=args.top, json_path=args.json)
+            return 0 if success else 1
+        
+        elif args.command == 'analyze-includes':
+            success = build_system.analyze_includes(top=args.top, filter_text=args.filter, jobs=args.jobs)
+            return 0 if success else 1
+        
+        elif args.command == 'store':
+            success = build_system.show_engine_store(
+                max_size=int(args.max_size * (1 << 30)) if args.max_size is not None else None
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'pch':
+            success = build_system.generate_pch(
+                modules=args.module,
+                min_share=args.min_share,
+                max_headers=args.max_headers,
+                refresh=args.refresh
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'bench':
+            success = build_system.benchmark_noop_build(
+                config=args.config,
+                preset=args.preset,
+                runs=args.runs,
+                budget_ms=args.budget_ms
+            )
+            return 0 if success else 1
+        
+        elif args.command == 'clean':
+            success = build_system.clean(all_trees=args.all_trees)
+            return 0 if success else 1
+        
+        elif args.command == 'install':
+            success = build_system.install(config=args.config, trace=args.trace)
+            return 0 if success else 1
+        
+        elif args.command == 'test':
+            success = build_system.test()
+            return 0 if success else 1
+        
+    except KeyboardInterrupt:
+        print_error("\nBuild interrupted by user")
+        return 1
+    except Exception as e:
+        print_error(f"Unexpected error: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+    
+    return 0
+
+class BuildDaemon:
+    """Serves zbuild commands from one long-lived BuildSystem
+    
+    Requests are handled one at a time: builds compete for the same cores
+    and build directory anyway, and BuildSystem is not thread-safe.
+    """
+    
+    HISTORY_LIMIT = 100
+    
+    def __init__(self, root_dir: Path):
+        self.root_dir = root_dir
+        self.socket_path = Path(daemon_socket_path(root_dir))
+        self.build_system = BuildSystem(root_dir)
+        self.script_mtime = script_mtime()
+        self.started = time.time()
+        self.history: List[dict] = []
+        self.running = False
+        # Set while the command of a client that asked to cancel is interrupted
+        self.cancelled = threading.Event()
+    
+    def serve(self) -> int:
+        if daemon_request(self.root_dir, {"control": "ping"}):
+            print_error(f"A daemon is already listening on {self.socket_path}")
+            return 1
+        
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.socket_path.unlink()
+        except OSError:
+            pass
+        
+        # Cancelling a command interrupts this process group, which holds the
+        # daemon and the build tools it runs but nothing that started it
+        try:
+            os.setpgid(0, 0)
+        except OSError:
+            pass
+        
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.socket_path))
+        server.listen(16)
+        # Client output interleaves with child processes, so never hold it back
+        sys.stdout.reconfigure(line_buffering=True)
+        print_info(f"zbuild daemon listening on {self.socket_path} (pid {os.getpid()})")
+        
+        # Warm up the caches a cold CLI invocation would otherwise pay for
+        self.build_system.probe_toolchain()
+        self.build_system.load_presets()
+        
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    conn, _ = server.accept()
+                    with conn:
+                        self._handle(conn)
+                except KeyboardInterrupt:
+                    # The interrupt of a cancelled command can land after it returned
+                    if not self.cancelled.is_set():
+                        break
+                    self.cancelled.clear()
+        finally:
+            server.close()
+            try:
+                self.socket_path.unlink()
+            except OSError:
+                pass
+        print_info("zbuild daemon stopped")
+        return 0
+    
+    def _handle(self, conn: socket.socket):
+        try:
+            data, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+            message = recv_message(conn, data)
+        except (OSError, ValueError):
+            return
+        if message is None:
+            return
+        
+        try:
+            if message.get("control") == "ping":
+                reply = {"pid": os.getpid()}
+            elif message.get("control") == "stop":
+                self.running = False
+                reply = {"stopped": True}
+            elif message.get("control") == "status":
+                reply = {"pid": os.getpid(), "uptime": time.time() - self.started,
+                         "history": self.history}
+            elif message.get("script_mtime") != self.script_mtime:
+                # zbuild.py was edited since the daemon started; let the client
+                # run the command itself and exit so a fresh daemon can start
+                self.running = False
+                reply = {"stale": True}
+            elif len(fds) == 2:
+                reply = {"exit": self._run_cancellable(conn, message, fds)}
+            else:
+                reply = {"error": "missing stdio descriptors"}
+        finally:
+            for fd in fds:
+                os.close(fd)
+        
+        try:
+            conn.sendall(json.dumps(reply).encode() + b"\n")
+        except OSError:
+            pass
+    
+    def _run_cancellable(self, conn: socket.socket, message: dict, fds: List[int]) -> int:
+        """Run a command, interrupting it if the client asks to or goes away
+        
+        The interrupt reaches the build tools the command started as well
+        as the daemon, which turns it into the command's exit code.
+        """
+        self.cancelled.clear()
+        done = threading.Event()
+        
+        def watch():
+            try:
+                conn.recv(65536)
+            except OSError:
+                pass
+            if not done.is_set():
+                self.cancelled.set()
+                os.killpg(os.getpgrp(), signal.SIGINT)
+        
+        watcher = threading.Thread(target=watch, name="zbuild-cancel", daemon=True)
+        watcher.start()
+        try:
+            exit_code = self._run(message, fds)
+        except KeyboardInterrupt:
+            exit_code = 130
+        done.set()
+        try:
+            conn.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+        watcher.join()
+        if self.cancelled.is_set():
+            exit_code = 130
+        return exit_code
+    
+    def _run(self, message: dict, fds: List[int]) -> int:
+        """Run one command with the client's stdio, environment and working directory"""
+        saved_fds = [os.dup(1), os.dup(2)]
+        saved_env = dict(os.environ)
+        saved_cwd = os.getcwd()
+        start = time.time()
+        exit_code = 1
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(fds[0], 1)
+            os.dup2(fds[1], 2)
+            os.environ.clear()
+            os.environ.update(message.get("env", {}))
+            os.chdir(message.get("cwd", saved_cwd))
+            
+            try:
+                args = create_parser().parse_args(message["argv"])
+                if not args.command or args.command == "daemon":
+                    print_error("Command not supported by the daemon")
+                else:
+                    exit_code = run_command(self.build_system, args)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            for fd in saved_fds:
+                os.close(fd)
+            os.environ.clear()
+            os.environ.update(saved_env)
+            os.chdir(saved_cwd)
+        
+        self.history.append({
+            "argv": message["argv"],
+            "exit": exit_code,
+            "started": start,
+            "duration": time.time() - start,
+        })
+        del self.history[:-self.HISTORY_LIMIT]
+        return exit_code
+
+
+def run_daemon(root_dir: Path, args: argparse.Namespace) -> int:
+    """Implement `zbuild.py daemon`"""
+    if not daemon_supported():
+        print_error("The zbuild daemon requires Unix domain sockets")
+        return 1
+    
+    if args.stop:
+        if daemon_request(root_dir, {"control": "stop"}) is None:
+            print_info("No daemon is running")
+        else:
+            print_success("Daemon stopped")
+        return 0
+    
+    if args.status:
+        reply = daemon_request(root_dir, {"control": "status"})
+        if reply is None:
+            print_info("No daemon is running")
+            return 1
+        print_info(f"Daemon pid {reply['pid']}, up {reply['uptime']:.0f}s")
+        for entry in reply["history"]:
+            started = time.strftime("%H:%M:%S", time.localtime(entry["started"]))
+            print_info(f"  {started}  exit {entry['exit']}  {entry['duration']:6.2f}s  "
+                       f"zbuild.py {' '.join(entry['argv'])}")
+        return 0
+    
+    if args.background:
+        subprocess.Popen(
+            [sys.executable, str(ZBUILD_SCRIPT), "daemon"],
+            cwd=root_dir,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if daemon_request(root_dir, {"control": "ping"}):
+                print_success(f"Daemon started on {daemon_socket_path(root_dir)}")
+                return 0
+            time.sleep(0.05)
+        print_error("Daemon did not start")
+        return 1
+    
+    return BuildDaemon(root_dir).serve()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    root_dir = Path(__file__).parent.absolute()
+    
+    # Links run through the launcher must not wait on a daemon or its checks
+    if argv and argv[0] == "link-launcher":
+        args = create_parser().parse_args(argv)
+        return run_link_launcher(Path(args.record), args.link_command)
+    
+    # As part of the build, precompile works on the tree it is given
+    if argv and argv[0] == "precompile":
+        args = create_parser().parse_args(argv)
+        build_system = BuildSystem(root_dir)
+        build_system.build_dir = Path(args.build_dir)
+        success = build_system.precompile(Path(args.parser), Path(args.params), Path(args.parser_input),
+                                          Path(args.source_dir), args.sys_include, args.module,
+                                          [Path(path) for path in args.include_dirs if path], shards=args.shards,
+                                          depfile=Path(args.depfile) if args.depfile else None)
+        return 0 if success else 1
+    
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    
+    if not args.command:
+        parser.print_help()
+        return 1
+    
+    if args.command == 'daemon':
+        return run_daemon(root_dir, args)
+    
+    return run_command(BuildSystem(root_dir), args)